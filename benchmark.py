@@ -0,0 +1,205 @@
+'''
+Usage: python3 benchmark.py <benchmark> [arguments ...]
+Benchmarks for the CNF encodings. Available benchmarks:
+- encode [N_min N_max]: time the SatPuzzleSudokuGeneral encoding against the
+  nested loop reference encoder on empty N x N Latin Squares (default N =
+  4..25), also showing toCnf when the structural clauses are already cached
+- load <file>: time loading a DIMACS file with cnf_load and cnf_load_file
+- amo [N ...]: CNF size and solving time of each at most one encoding of
+  SatPuzzleSudokuGeneral on N x N Latin Squares and (for square N) Sudokus
+  with about half of the cells given (default N = 9 16 25)
+- skyscraper [file]: CNF size, encoding and solving time of
+  SatPuzzleSudokuSkyscraper on the puzzles of a janko_solver.py input file
+  (Sudoku_Wolkenkratzer) or on generated puzzles with clues on all four sides
+  and no givens (default 2x2, 2x3, 3x3 and 3x4 blocks)
+- backends <file> [count [spec ...]]: time checking the first count (default
+  all) puzzles of a janko_solver.py input file with each SAT backend (default
+  pycosat and the python-sat solvers that are installed)
+- option <file> <name> <value> [value ...]: compare the values of an encoding
+  option (from cnf_options, such as sum_encoding) on the puzzles of a
+  janko_solver.py input file, showing the average number of clauses and the
+  total encoding and solving times
+'''
+
+import ast
+from itertools import islice
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, Optional
+
+from cnf_encodings import amo_encodings
+from cnf_utils import cnf_load, cnf_load_file
+from sat_backends import available_backends, get_backend
+from sat_puzzle import *
+
+def _time(f: Callable, repeat: int = 3) -> float:
+    ''' best wall clock time of several runs '''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        best = min(best,time.perf_counter()-start)
+    return best
+
+def _reference_sudoku_cnf(puzzle: SatPuzzleSudokuGeneral) -> list[list[int]]:
+    ''' the original nested loop encoding of SatPuzzleSudokuGeneral.toCnf '''
+    result: list[list[int]] = []
+    x = lambda c,n : 1 + c*puzzle.nums + (n-1)
+    for c in range(puzzle.cells):
+        result.append([x(c,n) for n in range(1,puzzle.nums+1)])
+    for c in range(puzzle.cells):
+        for n1 in range(1,puzzle.nums+1):
+            for n2 in range(n1+1,puzzle.nums+1):
+                result.append([-x(c,n1),-x(c,n2)])
+    for area in puzzle.areas:
+        for n in range(1,puzzle.nums+1):
+            result.append([x(c,n) for c in area])
+            for i,c1 in enumerate(area):
+                for c2 in area[i+1:]:
+                    result.append([-x(c1,n),-x(c2,n)])
+    for c,n in enumerate(puzzle.givens):
+        if n != 0:
+            result.append([x(c,n)])
+    return result
+
+def bench_encode(args: list[str]):
+    lo,hi = (int(args[0]),int(args[1])) if len(args) >= 2 else (4,25)
+    print(f'{"N":>3} {"clauses":>9} {"reference":>10} {"encode":>10} {"speedup":>8} {"cached":>10}')
+    for N in range(lo,hi+1):
+        puzzle = SatPuzzleLatinSquare([[0]*N for _ in range(N)])
+        cnf = puzzle.toCnf()
+        assert cnf.tolist() == _reference_sudoku_cnf(puzzle), f'different output for N = {N}'
+        t_ref = _time(lambda : _reference_sudoku_cnf(puzzle))
+        t_new = _time(puzzle.structureCnf)
+        t_cached = _time(puzzle.toCnf)
+        print(f'{N:>3} {len(cnf):>9} {t_ref:>10.4f} {t_new:>10.4f} {t_ref/t_new:>7.2f}x {t_cached:>10.4f}')
+
+def _sudoku_grid(br: int, bc: int, fill: float, seed: int = 0) -> list[list[int]]:
+    ''' a solved br*bc Sudoku (pattern with shuffled values) with random cells kept '''
+    N = br*bc
+    rng = random.Random(seed)
+    values = list(range(1,N+1))
+    rng.shuffle(values)
+    return [[values[(bc*(r%br)+r//br+c)%N] if rng.random() < fill else 0
+        for c in range(N)] for r in range(N)]
+
+def bench_amo(args: list[str]):
+    sizes = list(map(int,args)) if len(args) > 0 else [9,16,25]
+    print(f'{"puzzle":<12} {"encoding":<11} {"variables":>9} {"clauses":>9} {"solve":>9}')
+    for N in sizes:
+        puzzles: list[tuple[str,SatPuzzleSudokuGeneral]] = \
+            [(f'latin {N}',SatPuzzleLatinSquare(_sudoku_grid(1,N,0.5)))]
+        b = int(N**0.5)
+        if b*b == N:
+            puzzles.append((f'sudoku {b}x{b}',SatPuzzleSudokuStandard(b,b,_sudoku_grid(b,b,0.5))))
+        for name,puzzle in puzzles:
+            for encoding in amo_encodings:
+                puzzle.amo_encoding = encoding
+                variables,clauses = puzzle.cnfStats()
+                t = _time(puzzle.solve,1)
+                print(f'{name:<12} {encoding:<11} {variables:>9} {clauses:>9} {t:>9.4f}')
+
+def bench_skyscraper(args: list[str]):
+    if len(args) > 0:
+        puzzles = _janko_puzzles(args[0])
+    else:
+        from janko_solver import _sudoku_skyscraper
+        puzzles = []
+        for br,bc in [(2,2),(2,3),(3,3),(3,4)]:
+            for seed in range(3):
+                solution = _sudoku_grid(br,bc,1.0,seed)
+                data = {'patterny': br, 'patternx': bc, 'solution': [list(map(str,row)) for row in solution]}
+                puzzles.append(_sudoku_skyscraper(data))
+    print(f'{"category":<9} {"variables":>9} {"clauses":>9} {"encode":>9} {"solve":>9} status')
+    for solver,solution,category in puzzles:
+        start = time.perf_counter()
+        variables,clauses = solver.cnfStats()
+        t_encode = time.perf_counter()-start
+        start = time.perf_counter()
+        status = solver.verifySolution(solution)
+        t_solve = time.perf_counter()-start
+        print(f'{category:<9} {variables:>9} {clauses:>9} {t_encode:>9.4f} {t_solve:>9.4f} {status}')
+
+def bench_load(args: list[str]):
+    path = args[0]
+    cnf = cnf_load_file(path)
+    print(f'{path}: {cnf.variables} variables, {len(cnf)} clauses')
+    def load_text():
+        with open(path,'r') as f:
+            cnf_load(f.read())
+    print(f'cnf_load                 {_time(load_text,1):.3f}')
+    print(f'cnf_load_file            {_time(lambda : cnf_load_file(path)):.3f}')
+    print(f'cnf_load_file (no check) {_time(lambda : cnf_load_file(path,False)):.3f}')
+
+def _janko_puzzles(path: str, count: Optional[int] = None) -> list[tuple[SatPuzzleBase,Any,str]]:
+    ''' the (puzzle,solution,category) of the first count objects of a janko file '''
+    from janko_solver import iter_objects, load_index, parsers
+    base,ext = os.path.splitext(path)
+    if ext in ('.gz','.xz'):
+        base,_ = os.path.splitext(base)
+    parse = parsers[os.path.basename(base)]
+    return [parse(object['data']) for object in islice(iter_objects(path,load_index(path)),count)]
+
+def bench_backends(args: list[str]):
+    path = args[0]
+    count = int(args[1]) if len(args) >= 2 else None
+    specs = args[2:] if len(args) >= 3 else available_backends()
+    puzzles = _janko_puzzles(path,count)
+    for solver,_,_ in puzzles: # encode first so only solving is timed
+        solver.getCnf()
+    print(f'{len(puzzles)} puzzles')
+    print(f'{"backend":<24} {"total":>9} {"max":>9}')
+    for spec in specs:
+        backend = get_backend(spec)
+        times: list[float] = []
+        for solver,solution,_ in puzzles:
+            solver.setBackend(backend)
+            start = time.perf_counter()
+            assert solver.verifySolution(solution) == 'unique', f'{spec} failed'
+            times.append(time.perf_counter()-start)
+        print(f'{spec:<24} {sum(times):>9.4f} {max(times):>9.4f}')
+
+def bench_option(args: list[str]):
+    path,name = args[0],args[1]
+    values = []
+    for arg in args[2:]:
+        try:
+            values.append(ast.literal_eval(arg))
+        except (ValueError,SyntaxError): # plain string
+            values.append(arg)
+    puzzles = _janko_puzzles(path)
+    assert all(name in solver.cnf_options for solver,_,_ in puzzles), f'{name} is not an encoding option'
+    print(f'{len(puzzles)} puzzles')
+    print(f'{"value":<14} {"clauses":>10} {"encode":>9} {"solve":>9} {"max solve":>9}')
+    for value in values:
+        clauses = 0
+        encode: list[float] = []
+        solve: list[float] = []
+        for solver,solution,_ in puzzles:
+            setattr(solver,name,value)
+            start = time.perf_counter()
+            clauses += solver.cnfStats()[1]
+            encode.append(time.perf_counter()-start)
+            start = time.perf_counter()
+            assert solver.verifySolution(solution) != 'invalid', f'{value} failed'
+            solve.append(time.perf_counter()-start)
+        print(f'{str(value):<14} {clauses//len(puzzles):>10} {sum(encode):>9.4f} '
+            f'{sum(solve):>9.4f} {max(solve):>9.4f}')
+
+benchmarks: dict[str,Callable[[list[str]],None]] = \
+{
+    'encode': bench_encode,
+    'load': bench_load,
+    'amo': bench_amo,
+    'skyscraper': bench_skyscraper,
+    'backends': bench_backends,
+    'option': bench_option
+}
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        sys.stderr.write(__doc__)
+        quit()
+    benchmarks[sys.argv[1]](sys.argv[2:])
@@ -0,0 +1,303 @@
+'''
+CNF encodings of constraints on a list of literals. Each encoder appends its
+clauses to cnf (a CnfBuffer or list of clauses) and gets new (auxiliary)
+variables by calling new_var, such as itertools.count(first_free).__next__.
+
+At most one (AMO) encodings, amo_encodings maps their names to them:
+- pairwise: n(n-1)/2 binary clauses, no auxiliary variables
+- sequential: sequential counter (Sinz), 3n-4 clauses, n-1 variables
+- commander: commander variables for groups of 3 (Klieber and Kwon), with
+  AMO of the commanders encoded recursively
+- product: 2-product (Chen), the literals placed in a grid with row and column
+  variables, about 2n+4sqrt(n) clauses and 2sqrt(n) variables
+- bimander: groups of 2 with pairwise AMO and the group number in binary
+  (Nguyen and Mai), about n/2+n*log2(n/2) clauses and log2(n/2) variables
+
+Linear sums (of terms with one of several integer values, such as a puzzle
+cell with a one hot encoding of its value):
+- sum_mdd: layered decision diagram of the partial sums
+
+Others:
+- card_sequential: number of true literals in a range (sequential counter)
+- order_ladder: order (value >= k) variables for a one hot integer
+- xor_chain: parity of the literals, cut into short pieces
+'''
+
+from math import ceil
+from typing import Callable, Mapping, Optional, Sequence
+import unittest
+
+_new_var_t = Callable[[],int]
+
+def amo_pairwise(cnf, lits: Sequence[int], new_var: _new_var_t):
+    ''' not a or not b for each pair of literals '''
+    for i,a in enumerate(lits):
+        for b in lits[i+1:]:
+            cnf.append([-a,-b])
+
+def amo_sequential(cnf, lits: Sequence[int], new_var: _new_var_t):
+    ''' s_i means one of the first i literals is true '''
+    n = len(lits)
+    if n <= 1:
+        return
+    s = [new_var() for _ in range(n-1)]
+    cnf.append([-lits[0],s[0]])
+    for i in range(1,n-1):
+        cnf.append([-lits[i],s[i]])
+        cnf.append([-s[i-1],s[i]])
+        cnf.append([-lits[i],-s[i-1]])
+    cnf.append([-lits[n-1],-s[n-2]])
+
+def amo_commander(cnf, lits: Sequence[int], new_var: _new_var_t, group_size: int = 3):
+    ''' a true literal implies the commander of its group, AMO of commanders '''
+    if len(lits) <= group_size+1:
+        amo_pairwise(cnf,lits,new_var)
+        return
+    commanders: list[int] = []
+    for i in range(0,len(lits),group_size):
+        group = lits[i:i+group_size]
+        amo_pairwise(cnf,group,new_var)
+        c = new_var()
+        for x in group:
+            cnf.append([-x,c])
+        commanders.append(c)
+    amo_commander(cnf,commanders,new_var,group_size)
+
+def amo_product(cnf, lits: Sequence[int], new_var: _new_var_t):
+    ''' literal k implies row k//q and column k%q, AMO of rows and columns '''
+    n = len(lits)
+    if n <= 4:
+        amo_pairwise(cnf,lits,new_var)
+        return
+    q = ceil(n**0.5)
+    p = ceil(n/q)
+    rows = [new_var() for _ in range(p)]
+    cols = [new_var() for _ in range(q)]
+    for k,x in enumerate(lits):
+        cnf.append([-x,rows[k//q]])
+        cnf.append([-x,cols[k%q]])
+    amo_product(cnf,rows,new_var)
+    amo_product(cnf,cols,new_var)
+
+def amo_bimander(cnf, lits: Sequence[int], new_var: _new_var_t, group_size: int = 2):
+    ''' a true literal implies the bits of its group number '''
+    n = len(lits)
+    groups = ceil(n/group_size)
+    if groups <= 1:
+        amo_pairwise(cnf,lits,new_var)
+        return
+    bits = [new_var() for _ in range((groups-1).bit_length())]
+    for g in range(groups):
+        group = lits[g*group_size:(g+1)*group_size]
+        amo_pairwise(cnf,group,new_var)
+        for x in group:
+            for j,b in enumerate(bits):
+                cnf.append([-x,b if g>>j & 1 else -b])
+
+amo_encodings: dict[str,Callable] = \
+{
+    'pairwise': amo_pairwise,
+    'sequential': amo_sequential,
+    'commander': amo_commander,
+    'product': amo_product,
+    'bimander': amo_bimander
+}
+
+def sum_mdd(cnf, terms: Sequence[Mapping[int,int]], target: int, new_var: _new_var_t,
+        upper: Optional[int] = None):
+    '''
+    The sum of the terms equals target (or target <= sum <= upper if upper is
+    given). Each term maps its possible values to literals, exactly one of
+    which must be true (not encoded here). Layer j has a variable p(j,s) for
+    each sum s of the first j terms from which the range is still reachable
+    but not certain (using the minimum and maximum of the remaining terms).
+    The clauses are p(j,s) and x(j,n) implies p(j+1,s+n), or not both if s+n
+    cannot reach the range, so the partial sums are forced along the true
+    values. This has O(k*S*V) clauses for k terms, S sums and V values.
+    '''
+    if upper is None:
+        upper = target
+    k = len(terms)
+    if k == 0:
+        if not target <= 0 <= upper:
+            cnf.append([])
+        return
+    lo = [0]*(k+1) # lo[j],hi[j] = range of sums of terms j..k-1
+    hi = [0]*(k+1)
+    for j in range(k-1,-1,-1):
+        lo[j] = lo[j+1]+min(terms[j])
+        hi[j] = hi[j+1]+max(terms[j])
+    layer: dict[int,Optional[int]] = {0: None} # sum -> variable, None for true
+    for j,term in enumerate(terms):
+        next_layer: dict[int,Optional[int]] = dict()
+        for s,p in layer.items():
+            for n,x in term.items():
+                t = s+n
+                if target <= t+lo[j+1] and t+hi[j+1] <= upper: # in range whatever follows
+                    continue
+                clause = [-x] if p is None else [-p,-x]
+                if target <= t+hi[j+1] and t+lo[j+1] <= upper:
+                    if t not in next_layer:
+                        next_layer[t] = new_var()
+                    clause.append(next_layer[t])
+                cnf.append(clause)
+        layer = next_layer
+
+def card_sequential(cnf, lits: Sequence[int], lo: int, hi: int, new_var: _new_var_t):
+    '''
+    lo <= (number of true literals) <= hi. Variable s(i,j) is equivalent to
+    at least j of the first i literals being true (1 <= j <= min(i,hi+1)):
+    - s(i-1,j) implies s(i,j)
+    - x_i and s(i-1,j-1) implies s(i,j)
+    - s(i,j) implies s(i-1,j) or x_i
+    - s(i,j) implies s(i-1,j-1)
+    where s(i,0) is true and s(i,j) is false for j > i. The result is then
+    s(n,lo) and not s(n,hi+1). This has O(n*min(n,hi)) clauses and variables.
+    '''
+    n = len(lits)
+    hi = min(hi,n)
+    lo = max(lo,0)
+    if lo > hi:
+        cnf.append([])
+        return
+    if lo == 0 and hi == n:
+        return
+    top = min(hi+1,n)
+    prev: list[int] = [0] # s(i-1,j) for j < len(prev), index 0 is true
+    for i,x in enumerate(lits,1):
+        cur = [0]+[new_var() for _ in range(min(i,top))]
+        for j in range(1,len(cur)):
+            s = cur[j]
+            if j < len(prev): # s(i-1,j) is a variable (otherwise false)
+                a = prev[j]
+                cnf.append([-a,s])
+                cnf.append([-s,a,x])
+            else:
+                cnf.append([-s,x])
+            if j == 1: # s(i-1,0) is true
+                cnf.append([-x,s])
+            else:
+                b = prev[j-1]
+                cnf.append([-x,-b,s])
+                cnf.append([-s,b])
+        prev = cur
+    if lo > 0:
+        cnf.append([prev[lo]])
+    if hi < n:
+        cnf.append([-prev[hi+1]])
+
+def order_ladder(cnf, lits: Sequence[int], new_var: _new_var_t) -> list[int]:
+    '''
+    Order variables for an integer with value n (1 <= n <= len(lits)) when
+    lits[n-1] is true (exactly one, not encoded here). Returns g where g[k]
+    (2 <= k <= len(lits)) is equivalent to value >= k (g[0] and g[1] unused):
+    - g[k+1] implies g[k]
+    - lits[n-1] is equivalent to g[n] and not g[n+1]
+    '''
+    N = len(lits)
+    g = [0,0]+[new_var() for _ in range(2,N+1)]
+    for k in range(2,N):
+        cnf.append([-g[k+1],g[k]])
+    for n,x in enumerate(lits,1):
+        clause = [x]
+        if n > 1:
+            cnf.append([-x,g[n]])
+            clause.append(-g[n])
+        if n < N:
+            cnf.append([-x,-g[n+1]])
+            clause.append(g[n+1])
+        cnf.append(clause)
+    return g
+
+def _xor_clauses(cnf, lits: Sequence[int], parity: bool):
+    ''' exclude every sign pattern of the literals with the wrong parity '''
+    for negated in range(1<<len(lits)): # clause excludes lits[i] true iff bit i
+        if bin(negated).count('1')%2 != parity:
+            cnf.append([-x if negated>>i & 1 else x for i,x in enumerate(lits)])
+
+def xor_chain(cnf, lits: Sequence[int], parity: bool, new_var: _new_var_t, cut: int = 3):
+    '''
+    An odd (or even if not parity) number of the literals are true. While more
+    than cut+1 literals remain, the first cut are replaced by a new variable t
+    equivalent to their XOR (t xor l1 xor .. xor l_cut is even), since a XOR of
+    k literals needs 2^(k-1) clauses. This has about n/(cut-1) pieces of at
+    most cut+1 literals, the last piece has the last literal.
+    '''
+    assert cut >= 2
+    lits = list(lits)
+    while len(lits) > cut+1:
+        t = new_var()
+        _xor_clauses(cnf,[t]+lits[:cut],False)
+        lits = [t]+lits[cut:]
+    _xor_clauses(cnf,lits,parity)
+
+class TestAmo(unittest.TestCase):
+    def test_amo(self):
+        import pycosat
+        from itertools import count, product
+        for name,amo in amo_encodings.items():
+            for n in range(1,10):
+                cnf: list[list[int]] = []
+                amo(cnf,list(range(1,n+1)),count(n+1).__next__)
+                for values in product([False,True],repeat=n):
+                    units = [[v if t else -v] for v,t in zip(range(1,n+1),values)]
+                    sat = pycosat.solve(cnf+units) != 'UNSAT'
+                    self.assertEqual(sum(values) <= 1,sat,f'{name} n = {n} {values}')
+
+class TestSum(unittest.TestCase):
+    def test_sum_mdd(self):
+        import pycosat
+        from itertools import count, product
+        values = [[1,2,3],[2,4],[0,1,5]]
+        lits = count(1)
+        terms = [{n: next(lits) for n in term} for term in values]
+        for target in range(-1,14):
+            cnf: list[list[int]] = []
+            sum_mdd(cnf,terms,target,count(9).__next__)
+            for choice in product(*values):
+                units = [[t[n] if n == m else -t[n]] for t,m in zip(terms,choice) for n in t]
+                sat = pycosat.solve(cnf+units) != 'UNSAT'
+                self.assertEqual(sum(choice) == target,sat,f'{target} {choice}')
+        for target,upper in [(3,7),(-5,4),(8,20),(6,5)]:
+            cnf = []
+            sum_mdd(cnf,terms,target,count(9).__next__,upper)
+            for choice in product(*values):
+                units = [[t[n] if n == m else -t[n]] for t,m in zip(terms,choice) for n in t]
+                sat = pycosat.solve(cnf+units) != 'UNSAT'
+                self.assertEqual(target <= sum(choice) <= upper,sat,f'{target} {upper} {choice}')
+    def test_card_sequential(self):
+        import pycosat
+        from itertools import count, product
+        for n in range(0,7):
+            for lo in range(-1,n+2):
+                for hi in range(lo,n+2):
+                    cnf: list[list[int]] = []
+                    card_sequential(cnf,list(range(1,n+1)),lo,hi,count(n+1).__next__)
+                    for values in product([False,True],repeat=n):
+                        units = [[v if t else -v] for v,t in zip(range(1,n+1),values)]
+                        sat = pycosat.solve(cnf+units) != 'UNSAT'
+                        self.assertEqual(lo <= sum(values) <= hi,sat,f'{lo} {hi} {values}')
+    def test_xor_chain(self):
+        import pycosat
+        from itertools import count, product
+        for n in range(0,8):
+            for parity in (False,True):
+                cnf: list[list[int]] = []
+                xor_chain(cnf,list(range(1,n+1)),parity,count(n+1).__next__,2+n%2)
+                for values in product([False,True],repeat=n):
+                    units = [[v if t else -v] for v,t in zip(range(1,n+1),values)]
+                    sat = pycosat.solve(cnf+units) != 'UNSAT'
+                    self.assertEqual(sum(values)%2 == parity,sat,f'{parity} {values}')
+    def test_order_ladder(self):
+        import pycosat
+        from itertools import count
+        N = 5
+        cnf: list[list[int]] = [list(range(1,N+1))]
+        g = order_ladder(cnf,list(range(1,N+1)),count(N+1).__next__)
+        for model in pycosat.itersolve(cnf):
+            true = set(v for v in model if v > 0)
+            value, = [n for n in range(1,N+1) if n in true]
+            self.assertEqual([k <= value for k in range(2,N+1)],[g[k] in true for k in range(2,N+1)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,158 @@
-from typing import List, Tuple
+from array import array
+import gzip
+import io
+from itertools import compress, count, islice
+import lzma
+import mmap
+from operator import not_, sub
+import os
+import random
+import re
+import struct
+import sys
+import tempfile
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
 import unittest
 
-def cnf_stats(cnf: List[List[int]]) -> Tuple[int,int]:
+class CnfBuffer:
+    '''
+    Compact storage for a list of clauses. The literals of all clauses are kept
+    in one flat int32 array and clause i is lits[offsets[i]:offsets[i+1]]. The
+    number of variables (largest variable used) is tracked as clauses are
+    appended. It supports append, extend, len, indexing and iteration so it can
+    be used in place of a list of clauses, including passing it to pycosat.
+    A buffer loaded by cnf_load_binary uses read only memoryviews of the mapped
+    file for lits and offsets, so clauses cannot be added to it (use copy).
+    '''
+    def __init__(self, clauses: Iterable[Iterable[int]] = ()):
+        self.lits = array('i')
+        self.offsets = array('q',[0])
+        self._variables = 0
+        self._scanned = 0 # prefix of lits included in _variables
+        self.extend(clauses)
+    @property
+    def variables(self) -> int:
+        ''' largest variable number used (updated lazily) '''
+        if self._scanned < len(self.lits):
+            added = self.lits[self._scanned:]
+            self._variables = max(self._variables,max(added),-min(added))
+            self._scanned = len(self.lits)
+        return self._variables
+    def append(self, clause: Iterable[int]):
+        ''' add a clause (iterable of nonzero literals) '''
+        self.lits.extend(clause)
+        self.offsets.append(len(self.lits))
+    def extend(self, clauses: Iterable[Iterable[int]]):
+        ''' add several clauses '''
+        lits = self.lits
+        offsets = self.offsets
+        for clause in clauses:
+            lits.extend(clause)
+            offsets.append(len(lits))
+    def extend_fixed(self, lits: Iterable[int], width: int):
+        '''
+        add clauses that all have the same width, given as one flat sequence
+        of literals (the first width literals are the first clause and so on)
+        '''
+        assert width > 0
+        start = len(self.lits)
+        self.lits.extend(lits)
+        end = len(self.lits)
+        assert (end-start) % width == 0
+        self.offsets.extend(range(start+width,end+1,width))
+    def copy(self) -> 'CnfBuffer':
+        ''' independent copy of the buffer (writable if this one is mapped) '''
+        result = CnfBuffer()
+        result.lits.frombytes(memoryview(self.lits).cast('B'))
+        result.offsets = array('q')
+        result.offsets.frombytes(memoryview(self.offsets).cast('B'))
+        result._variables = self._variables
+        result._scanned = self._scanned
+        return result
+    def __len__(self) -> int:
+        return len(self.offsets)-1
+    def __getitem__(self, i: int) -> array:
+        if i < 0:
+            i += len(self)
+        return self.lits[self.offsets[i]:self.offsets[i+1]]
+    def __iter__(self) -> Iterator[array]:
+        offsets = self.offsets
+        return map(self.lits.__getitem__,map(slice,offsets,islice(offsets,1,None)))
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other,CnfBuffer) and self.lits == other.lits \
+            and self.offsets == other.offsets
+    def tolist(self) -> List[List[int]]:
+        ''' convert to the list of lists representation '''
+        return [clause.tolist() for clause in self]
+
+_cnf_t = Union[List[List[int]],CnfBuffer]
+
+def cnf_stats(cnf: _cnf_t) -> Tuple[int,int]:
     ''' get number of variables and clauses '''
+    if isinstance(cnf,CnfBuffer):
+        return cnf.variables, len(cnf)
     return max(max(abs(v) for v in clause) for clause in cnf), len(cnf)
 
-def cnf_dump(cnf: List[List[int]]) -> str:
+def cnf_dump(cnf: _cnf_t) -> str:
     ''' convert cnf expression to text data (can be saved to file) '''
-    assert all(all(v != 0 for v in clause) for clause in cnf)
+    if isinstance(cnf,CnfBuffer):
+        assert 0 not in cnf.lits
+    else:
+        assert all(all(v != 0 for v in clause) for clause in cnf)
     variables, clauses = cnf_stats(cnf)
     result = f'p cnf {variables} {clauses}\n' \
         + ''.join(' '.join(map(str,clause)) + ' 0\n' for clause in cnf)
     return result
 
+def cnf_write(fileobj: BinaryIO, cnf: Iterable[Iterable[int]],
+        variables: Optional[int] = None, clauses: Optional[int] = None,
+        compress: Optional[str] = None, chunk_size: int = 1<<14):
+    '''
+    write cnf expression in DIMACS format to a binary file object, the clauses
+    are converted and written in chunks of chunk_size so any iterable of clauses
+    (such as from SatPuzzleBase.iterCnf) can be written in constant memory
+    variables, clauses = header values, required unless cnf is a list/CnfBuffer
+    compress = None (plain text), 'gzip' or 'xz'
+    '''
+    if variables is None or clauses is None:
+        assert isinstance(cnf,(list,CnfBuffer)), 'header counts required'
+        variables, clauses = cnf_stats(cnf)
+    if compress is None:
+        out = fileobj
+    elif compress == 'gzip':
+        out = gzip.GzipFile(fileobj=fileobj,mode='wb')
+    elif compress == 'xz':
+        out = lzma.LZMAFile(fileobj,'wb')
+    else:
+        assert 0, f'unknown compression {compress}'
+    out.write(f'p cnf {variables} {clauses}\n'.encode())
+    chunk: List[str] = []
+    written = 0
+    for clause in cnf:
+        line = ' '.join(map(str,clause))
+        chunk.append(line + ' 0\n' if line else '0\n')
+        if len(chunk) == chunk_size:
+            out.write(''.join(chunk).encode())
+            written += len(chunk)
+            chunk.clear()
+    out.write(''.join(chunk).encode())
+    written += len(chunk)
+    if out is not fileobj: # finish compressed stream, fileobj stays open
+        out.close()
+    assert written == clauses, f'header has {clauses} clauses, wrote {written}'
+
+def cnf_shuffle(cnf: _cnf_t, seed: int) -> CnfBuffer:
+    '''
+    copy of cnf with the clauses and the literals in each clause in a random
+    order determined by seed, which changes the search of most SAT solvers
+    '''
+    rng = random.Random(seed)
+    clauses = [list(clause) for clause in cnf]
+    rng.shuffle(clauses)
+    for clause in clauses:
+        rng.shuffle(clause)
+    return CnfBuffer(clauses)
+
 def cnf_load(cnf: str) -> List[List[int]]:
     ''' load cnf expression from text data (can be read from a file) '''
     lines = [line.split() for line in cnf.splitlines()]
@@ -29,6 +169,116 @@ def cnf_load(cnf: str) -> List[List[int]]:
         result.append(line[:-1])
     return result
 
+# binary format: header (magic, version, variables, clauses, literals), then
+# the literals (int32), padding to a multiple of 8 bytes and the clause offsets
+# (int64, clauses+1 of them starting with 0), all little endian
+_binary_header = struct.Struct('<4sIqqq')
+_binary_magic = b'CNFB'
+_binary_version = 1
+
+def cnf_save_binary(path: str, cnf: CnfBuffer):
+    '''
+    save cnf expression in the binary format, the file is written to a temporary
+    name first and then renamed so readers never see a partial file
+    '''
+    lits = cnf.lits
+    offsets = cnf.offsets
+    if sys.byteorder != 'little':
+        cnf = cnf.copy()
+        lits = cnf.lits
+        offsets = cnf.offsets
+        lits.byteswap()
+        offsets.byteswap()
+    fd,tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd,'wb') as f:
+            f.write(_binary_header.pack(_binary_magic,_binary_version,
+                cnf.variables,len(cnf),len(lits)))
+            f.write(lits)
+            f.write(bytes(-4*len(lits) % 8))
+            f.write(offsets)
+        os.replace(tmp,path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def cnf_load_binary(path: str) -> CnfBuffer:
+    '''
+    load cnf expression saved by cnf_save_binary, on little endian machines
+    the file is memory mapped and used directly without parsing or copying
+    '''
+    with open(path,'rb') as f:
+        data = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+    magic,version,variables,clauses,literals = _binary_header.unpack_from(data)
+    assert magic == _binary_magic and version == _binary_version, 'not a binary cnf file'
+    start = _binary_header.size
+    end = start + 4*literals
+    end += -end % 8
+    assert len(data) == end + 8*(clauses+1), 'truncated binary cnf file'
+    view = memoryview(data)
+    result = CnfBuffer()
+    result.lits = view[start:start+4*literals].cast('i')
+    result.offsets = view[end:].cast('q')
+    if sys.byteorder != 'little':
+        result = result.copy()
+        result.lits.byteswap()
+        result.offsets.byteswap()
+    result._variables = variables
+    result._scanned = literals
+    return result
+
+_comment_line = re.compile(rb'^[ \t]*c.*$',re.MULTILINE)
+
+def cnf_load_file(path: str, validate: bool = True, chunk_size: int = 1<<24) -> CnfBuffer:
+    '''
+    load cnf expression from a DIMACS file, the file is memory mapped and parsed
+    in chunks of whole lines by splitting and converting all numbers in bulk,
+    then clauses are split at the zeros
+    validate = check the clause count and variable range against the header
+    '''
+    with open(path,'rb') as f:
+        assert os.fstat(f.fileno()).st_size > 0, 'empty file'
+        with mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as data:
+            pos = 0
+            header: List[bytes] = []
+            while not header and pos < len(data): # skip comments
+                end = data.find(b'\n',pos)
+                end = len(data) if end < 0 else end
+                header = data[pos:end].split()
+                if header and header[0] == b'c':
+                    header = []
+                pos = end+1
+            assert len(header) == 4 and header[:2] == [b'p',b'cnf']
+            variables = int(header[2])
+            clauses = int(header[3])
+            raw = array('i') # literals including clause terminators
+            while pos < len(data):
+                end = len(data) if pos+chunk_size >= len(data) \
+                    else data.rfind(b'\n',pos,pos+chunk_size)
+                if end <= pos: # no line break in chunk_size bytes
+                    end = data.find(b'\n',pos+chunk_size)
+                    end = len(data) if end < 0 else end
+                chunk = data[pos:end]
+                pos = end+1
+                if b'c' in chunk:
+                    chunk = _comment_line.sub(b'',chunk)
+                if b'%' in chunk: # end marker used by some benchmark files
+                    raw.extend(map(int,chunk[:chunk.index(b'%')].split()))
+                    break
+                raw.extend(map(int,chunk.split()))
+    result = CnfBuffer()
+    # end of clause k is the position of the k-th zero minus k zeros before it
+    result.offsets.extend(map(sub,compress(count(),map(not_,raw)),count()))
+    result.lits = array('i',filter(None,raw))
+    if len(result.lits) > result.offsets[-1]: # last clause without a 0
+        assert not validate, 'last clause not terminated'
+        result.offsets.append(len(result.lits))
+    result._variables = variables
+    if validate:
+        assert len(result) == clauses, f'header has {clauses} clauses, found {len(result)}'
+        assert result.variables == variables, f'variable out of range 1..{variables}'
+    return result
+
 class TestDimacsCnf(unittest.TestCase):
     list1 = [[-1,2],[-1,3],[1,-2,-3]]
     text1 = 'p cnf 3 3\n-1 2 0\n-1 3 0\n1 -2 -3 0\n'
@@ -39,5 +289,62 @@ class TestDimacsCnf(unittest.TestCase):
     def test_load(self):
         self.assertEqual(self.list1,cnf_load(self.text1))
 
+    def test_load_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp,'test.cnf')
+            with open(path,'w') as f:
+                f.write('c comment\n' + self.text1.replace('\n-1 3','\nc x\n-1\n3'))
+            self.assertEqual(self.list1,cnf_load_file(path).tolist())
+            self.assertEqual(self.list1,cnf_load_file(path,chunk_size=4).tolist())
+            with open(path,'w') as f:
+                f.write(self.text1.replace('3 3','2 3'))
+            self.assertRaises(AssertionError,cnf_load_file,path)
+            self.assertEqual(self.list1,cnf_load_file(path,validate=False).tolist())
+    def test_binary(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp,'test.cnfb')
+            cnf_save_binary(path,CnfBuffer(self.list1+[[5]]))
+            cnf = cnf_load_binary(path)
+            self.assertEqual(self.list1+[[5]],cnf.tolist())
+            self.assertEqual((5,4),cnf_stats(cnf))
+            self.assertEqual(CnfBuffer(self.list1+[[5]]),cnf)
+            other = cnf.copy()
+            other.append([-6])
+            self.assertEqual((6,5),cnf_stats(other))
+    def test_write(self):
+        for compress,decompress in [(None,bytes),('gzip',gzip.decompress),('xz',lzma.decompress)]:
+            f = io.BytesIO()
+            cnf_write(f,iter(self.list1),3,3,compress,chunk_size=2)
+            self.assertEqual(self.text1,decompress(f.getvalue()).decode())
+
+class TestCnfBuffer(unittest.TestCase):
+    list1 = TestDimacsCnf.list1
+    def test_roundtrip(self):
+        buf = CnfBuffer(self.list1)
+        self.assertEqual(self.list1,buf.tolist())
+        self.assertEqual([1,-2,-3],list(buf[-1]))
+    def test_stats(self):
+        buf = CnfBuffer(self.list1)
+        self.assertEqual((3,3),cnf_stats(buf))
+        buf.append([-7])
+        buf.append([])
+        self.assertEqual((7,5),cnf_stats(buf))
+    def test_dump(self):
+        self.assertEqual(TestDimacsCnf.text1,cnf_dump(CnfBuffer(self.list1)))
+    def test_copy(self):
+        buf = CnfBuffer(self.list1)
+        other = buf.copy()
+        other.append([5])
+        self.assertEqual(self.list1,buf.tolist())
+        self.assertEqual((5,4),cnf_stats(other))
+    def test_extend_fixed(self):
+        buf = CnfBuffer([[4]])
+        buf.extend_fixed([-1,2,-1,3],2)
+        self.assertEqual([[4],[-1,2],[-1,3]],buf.tolist())
+    def test_shuffle(self):
+        buf = cnf_shuffle(self.list1,1)
+        self.assertEqual(buf,cnf_shuffle(CnfBuffer(self.list1),1))
+        self.assertEqual(sorted(map(sorted,self.list1)),sorted(map(sorted,buf.tolist())))
+
 if __name__ == '__main__':
     unittest.main()
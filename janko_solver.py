@@ -1,51 +1,113 @@
 '''
-Usage: python3 janko_solver.py <file> [special options ...]
-Expects .jsonl files (uncompressed) from the janko.at-puzzle-scraping repository
+Usage: python3 janko_solver.py <file> [special options ...] [--jobs N]
+    [--chunksize N] [--cnf-cache <dir>] [--start N] [--backend [CATEGORY=]SPEC]
+    [--no-sessions] [--portfolio CONFIG] [--encoding NAME=VALUE]
+Expects .jsonl files (may be compressed as .jsonl.gz or .jsonl.xz) from the
+janko.at-puzzle-scraping repository
 They should have original filenames for determining puzzle type
 The special options part is for testing/debugging purposes
+Objects are read one at a time. The byte offset of each object is saved in
+<file>.idx (rebuilt when the file changes) to count objects and seek to them.
+Seeking in a compressed file decompresses all data before the offset, so there
+the index only saves parsing the skipped objects.
+--start begins at object N (numbered from 1), for resuming a run
+--jobs solves the puzzles in N worker processes (default 1, in this process)
+--chunksize is the number of puzzles handed to a worker at a time
+--cnf-cache stores the CNF of each puzzle in <dir> so later runs load it
+--backend selects the SAT solver (see sat_backends.py, default pycosat) for all
+puzzles, or for one category (as in the timing summary) if CATEGORY= is given,
+may be repeated (for example --backend pysat:cadical195 --backend 3x3=pycosat)
+With an incremental backend (python-sat), puzzles of the same geometry that
+support it are solved in one session (the clauses are loaded once and the
+givens are assumptions, sessions for the last few geometries are kept),
+--no-sessions solves each puzzle separately
+--portfolio races configurations (see SatPuzzleBase.portfolio) in separate
+processes for each puzzle, may be repeated (for example --portfolio pycosat
+--portfolio pysat:cadical195,seed=1), the wins of each are shown per category
+--encoding sets an encoding option (see cnf_options of the puzzle classes) for
+the puzzles that have it, may be repeated (for example --encoding
+sum_encoding=mdd --encoding amo_encoding=commander)
 '''
 
+import argparse
+from array import array
+import ast
 from functools import reduce
+import gzip
 import json
+import lzma
+import multiprocessing
 import os
 from statistics import stdev
+import subprocess
 import sys
+import tempfile
+import threading
 import time
 from tqdm import tqdm
 import traceback
-from typing import Any, Callable
+from typing import Any, BinaryIO, Callable, Iterator, Optional
+import unittest
 
-from cnf_utils import cnf_stats
+from sat_backends import SatBackend, SatSession, get_backend
 from sat_puzzle import *
 
-# get part of filename before the .jsonl
-input_file = sys.argv[1]
-base,ext = os.path.splitext(input_file)
-assert ext == '.jsonl'
-puzzle_dir = os.path.basename(base)
-
-sys.stderr.write(f'input_file = {input_file}\n')
-sys.stderr.write(f'puzzle = {puzzle_dir}\n')
-
-objects: list[dict[str,Any]] = [json.loads(line) for line in open(input_file,'r')]
-sys.stderr.write(f'loaded {len(objects)} objects\n')
-
-if len(sys.argv) > 2: # extra option
-    option = sys.argv[2]
-    if option == 'list_params':
-        values = reduce(lambda x,y: x|y, (set(object['data'].keys()) for object in objects))
-        sys.stderr.write(f'parameters found = {values}\n')
-    elif option == 'list_param_values':
-        values = set(object['data'][sys.argv[3]] for object in objects if sys.argv[3] in object['data'])
-        count_missing = sum(1 for object in objects if sys.argv[3] not in object['data'])
-        sys.stderr.write(f'values found for parameter {sys.argv[3]} = {values}\n')
-        if count_missing > 0:
-            sys.stderr.write(f'counted {count_missing} objects without this parameter\n')
-    elif option == 'write_json':
-        sys.stderr.write(f'{json.dumps(objects[int(sys.argv[3])-1],indent=4)}\n')
-    else:
-        sys.stderr.write(f'invalid option = {sys.argv[2]}\n')
-    quit()
+def open_jsonl(input_file: str) -> BinaryIO:
+    ''' open a (possibly compressed) .jsonl file for reading in binary mode '''
+    if input_file.endswith('.gz'):
+        return gzip.open(input_file,'rb')
+    elif input_file.endswith('.xz'):
+        return lzma.open(input_file,'rb')
+    return open(input_file,'rb')
+
+def load_index(input_file: str) -> array:
+    '''
+    Byte offsets (in the uncompressed data) of each object in the file. These
+    are loaded from <file>.idx if it matches the file size and modification
+    time, otherwise found by reading the file and saved there if possible.
+    '''
+    stat = os.stat(input_file)
+    index_file = input_file + '.idx'
+    index = array('q')
+    try:
+        with open(index_file,'rb') as f:
+            index.frombytes(f.read())
+        if len(index) >= 2 and index[0] == stat.st_size and index[1] == stat.st_mtime_ns:
+            return index[2:]
+    except OSError:
+        pass
+    index = array('q',[stat.st_size,stat.st_mtime_ns])
+    offset = 0
+    with open_jsonl(input_file) as f:
+        for line in f:
+            if line.strip():
+                index.append(offset)
+            offset += len(line)
+    try:
+        with open(index_file,'wb') as f:
+            index.tofile(f)
+    except OSError:
+        sys.stderr.write(f'unable to save index {index_file}\n')
+    return index[2:]
+
+def iter_objects(input_file: str, index: array, start: int = 0) -> Iterator[dict[str,Any]]:
+    '''
+    generate the objects starting from object number start (from 0), for a
+    compressed file the data before it is still decompressed to seek there
+    '''
+    if start >= len(index): # past the last object
+        return
+    with open_jsonl(input_file) as f:
+        f.seek(index[start])
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def read_object(input_file: str, index: array, i: int) -> dict[str,Any]:
+    ''' read object number i (from 0), slow for a compressed file (see iter_objects) '''
+    with open_jsonl(input_file) as f:
+        f.seek(index[i])
+        return json.loads(f.readline())
 
 def gridnum2int(x: str) -> int:
     return 0 if x in '-.' else int(x)
@@ -67,22 +129,29 @@ def insert_timing(category: str, runtime: float):
         solving_times[category] = []
     solving_times[category].append(runtime)
 
-def check_solution(solver: SatPuzzleBase, solution: Any, category: str):
-    global solving_times
-    cnf = solver.toCnf()
-    variables,clauses = cnf_stats(cnf)
-    tqdm.write(f'generated CNF with {variables} variables and {clauses} clauses')
+def check_solution(solver: SatPuzzleBase, solution: Any, cnf_cache_dir: Optional[str] = None,
+        log: Callable[[str],None] = tqdm.write, portfolio: Optional[list[str]] = None) -> tuple[float,Optional[str]]:
+    '''
+    Checks the puzzle has exactly the given solution, returns the solving time
+    and the winner if portfolio configurations are raced to check it.
+    '''
+    if cnf_cache_dir is not None:
+        solver.cachedCnf(cnf_cache_dir)
+    variables,clauses = solver.cnfStats()
+    log(f'generated CNF with {variables} variables and {clauses} clauses')
     start = time.perf_counter()
-    solutions = list(solver.solveAll())
+    winner = None
+    if portfolio:
+        status,winner = solver.portfolio(portfolio,'verifySolution',solution)
+    else:
+        status = solver.verifySolution(solution)
     solving_time = time.perf_counter()-start
-    tqdm.write(f'solved in {solving_time} seconds')
-    #if len(solutions) > 1: print('a',[''.join(map(str,row)) for row in solutions[0]]);print('b',[''.join(map(str,row)) for row in solutions[1]])
-    if 0: # debug
-        for s in solutions:
-            print('\n'.join(map(str,s))+'\n-----')
-    assert len(solutions) == 1, f'found {len(solutions)} solutions'
-    assert solutions[0] == solution
-    insert_timing(category,solving_time)
+    log(f'solved in {solving_time} seconds')
+    if winner is not None:
+        log(f'portfolio winner is {winner}')
+    assert status != 'invalid', 'provided solution is not a solution'
+    assert status == 'unique', 'found multiple solutions'
+    return solving_time, winner
 
 def _not_implemented(data: dict[str,Any]) -> tuple[SatPuzzleBase,Any,str]:
     sys.stderr.write(f'not implemented\n')
@@ -331,6 +400,50 @@ def _sukaku(data: dict[str,Any]) -> tuple[SatPuzzleBase,Any,str]:
         solver = SatPuzzleSukaku(3,3,candidates) # assume all are standard 9x9 size
     return solver, solution, f'3x3'
 
+def _sudoku_killer(data: dict[str,Any]) -> tuple[SatPuzzleBase,Any,str]:
+    if 'patternx' in data:
+        blockR,blockC = data['patterny'],data['patternx']
+    else: # if not specified by above then use square root
+        blockR = blockC = {16:4,9:3,4:2}[data.get('size',9)]
+    solution = grid2numlist(data['solution'])
+    N = len(solution)
+    cages = data['areas']
+    # cage sums and whether numbers repeat in a cage from the solution
+    sums: dict[Any,int] = dict()
+    values: dict[Any,list[int]] = dict()
+    for r in range(N):
+        for c in range(N):
+            sums[cages[r][c]] = sums.get(cages[r][c],0) + solution[r][c]
+            values.setdefault(cages[r][c],[]).append(solution[r][c])
+    distinct = all(len(set(v)) == len(v) for v in values.values())
+    solver = SatPuzzleSudokuKiller(blockR,blockC,[[0]*N for _ in range(N)],cages,sums,distinct)
+    return solver, solution, f'{blockR}x{blockC}'
+
+def _sudoku_skyscraper(data: dict[str,Any]) -> tuple[SatPuzzleBase,Any,str]:
+    if 'patternx' in data:
+        blockR,blockC = data['patterny'],data['patternx']
+    else: # if not specified by above then use square root
+        blockR = blockC = {16:4,9:3,4:2}[data.get('size',9)]
+    solution = grid2numlist(data['solution'])
+    N = len(solution)
+    givens = grid2numlist(data['problem']) if 'problem' in data else [[0]*N for _ in range(N)]
+    if len(givens) != N or any(len(row) != N for row in givens): # not only the grid
+        givens = [[0]*N for _ in range(N)]
+    # clues on all sides from the solution
+    def visible(line: list[int]) -> int:
+        count,tallest = 0,0
+        for n in line:
+            if n > tallest:
+                count,tallest = count+1,n
+        return count
+    cols = [[solution[r][c] for r in range(N)] for c in range(N)]
+    top = [visible(col) for col in cols]
+    bottom = [visible(col[::-1]) for col in cols]
+    left = [visible(row) for row in solution]
+    right = [visible(row[::-1]) for row in solution]
+    solver = SatPuzzleSudokuSkyscraper(blockR,blockC,givens,top,bottom,left,right)
+    return solver, solution, f'{blockR}x{blockC}'
+
 # convert the data object to a solver object, provided solution, and category
 parsers: dict[str,Callable[[dict[str,Any]],tuple[SatPuzzleBase,Any,str]]] = \
 {
@@ -342,7 +455,7 @@ parsers: dict[str,Callable[[dict[str,Any]],tuple[SatPuzzleBase,Any,str]]] = \
     'Sudoku_Clueless-2': _sudoku_clueless2,
     'Sudoku_Flower': _sudoku_flower,
     'Sudoku_Gattai-8': _sudoku_gattai8,
-    'Sudoku_Killer': _not_implemented,
+    'Sudoku_Killer': _sudoku_killer,
     'Sudoku_Konsekutiv': _sudoku_consecutive,
     'Sudoku_Kropki': _sudoku_kropki,
     'Sudoku_Magic-Number': _sudoku_magicnumberx,
@@ -356,7 +469,7 @@ parsers: dict[str,Callable[[dict[str,Any]],tuple[SatPuzzleBase,Any,str]]] = \
     'Sudoku_Sumo': _sudoku_sumo,
     'Sudoku_Windmill': _sudoku_windmill,
     'Sudoku_Vergleich': _sudoku_comparison,
-    'Sudoku_Wolkenkratzer': _not_implemented,
+    'Sudoku_Wolkenkratzer': _sudoku_skyscraper,
     'Suguru': _suguru,
     'Hakyuu': _hakyuu,
     'Sukaku': _sukaku
@@ -368,45 +481,284 @@ skip_puzzles: dict[str,str] = \
     '/Hakyuu/469.a.x-janko': 'no solution provided'
 }
 
-global_start = time.perf_counter()
-category2nums: dict[str,list[int]] = dict()
-skip_count = 0
-i = 0
-sys.stderr.write('\n')
-for object in tqdm(objects):
-    i += 1
+
+# settings used by process_object (set in worker processes by init_worker)
+puzzle_dir = ''
+cnf_cache_dir: Optional[str] = None
+# map category -> SAT backend, key None for the default
+backends: dict[Optional[str],SatBackend] = dict()
+use_sessions = True
+portfolio_configs: list[str] = []
+# encoding option name -> value
+encoding_options: dict[str,Any] = dict()
+# sessions for the geometries of the last puzzles (in this process)
+sessions: dict[tuple,SatSession] = dict()
+max_sessions = 8
+
+def parse_backends(args: list[str]) -> dict[Optional[str],str]:
+    ''' parse --backend arguments to a map category -> spec '''
+    result: dict[Optional[str],str] = dict()
+    for arg in args:
+        category,sep,spec = arg.partition('=')
+        if sep and ':' not in category and ' ' not in category:
+            result[category] = spec
+        else: # = is part of the spec
+            result[None] = arg
+    return result
+
+def parse_encodings(args: list[str]) -> dict[str,Any]:
+    ''' parse --encoding arguments, values are Python literals or strings '''
+    result: dict[str,Any] = dict()
+    for arg in args:
+        name,sep,value = arg.partition('=')
+        assert sep, f'invalid encoding option {arg}'
+        try:
+            result[name] = ast.literal_eval(value)
+        except (ValueError,SyntaxError):
+            result[name] = value
+    return result
+
+def init_worker(directory: str, cache_dir: Optional[str], backend_specs: dict[Optional[str],str],
+        sessions: bool = True, encodings: Optional[dict[str,Any]] = None):
+    global puzzle_dir, cnf_cache_dir, backends, use_sessions
+    puzzle_dir = directory
+    cnf_cache_dir = cache_dir
+    backends = {category: get_backend(spec) for category,spec in backend_specs.items()}
+    use_sessions = sessions
+    if encodings is not None:
+        encoding_options.update(encodings)
+
+def use_session(solver: SatPuzzleBase, backend: SatBackend):
+    '''
+    Solve with the session of a previous puzzle with the same geometry,
+    otherwise start a new session (if supported).
+    '''
+    key = solver.sessionKey()
+    if key is None:
+        return
+    key = (backend.spec,key)
+    if key not in sessions:
+        if len(sessions) >= max_sessions: # close the oldest
+            sessions.pop(next(iter(sessions))).close()
+        sessions[key] = solver.newSession()
+    solver.setSession(sessions[key])
+
+def throttle(items: Iterator[Any], window: threading.Semaphore, stopped: threading.Event) -> Iterator[Any]:
+    '''
+    Generate the items, each after acquiring the window (released when its
+    result is used). Stops when stopped is set, which must be done before
+    terminating a pool waiting here for the window (terminate waits for the
+    thread reading the items).
+    '''
+    for item in items:
+        while not window.acquire(timeout=0.1):
+            if stopped.is_set():
+                return
+        yield item
+
+def process_object(item: tuple[int,dict[str,Any]]) -> dict[str,Any]:
+    '''
+    Parses and solves object number i, returning the result as a dict with the
+    output lines (log), category, solving time, portfolio winner and error (None
+    if successful).
+    '''
+    i,object = item
     object_file = object['file']
+    result: dict[str,Any] = {'i': i, 'log': [], 'category': None, 'time': None, 'error': None,
+        'winner': None}
     if object_file in skip_puzzles:
-        tqdm.write(f'SKIPPING OBJECT {i} = {object_file}')
-        tqdm.write(f'reason = {skip_puzzles[object_file]}')
-        skip_count += 1
+        result['log'].append(f'SKIPPING OBJECT {i} = {object_file}')
+        result['log'].append(f'reason = {skip_puzzles[object_file]}')
+        result['skipped'] = True
+        return result
+    result['skipped'] = False
+    result['log'].append(f'processing object {i} = {object_file}')
+    try:
+        solver,solution,category = parsers[puzzle_dir](object['data'])
+        result['category'] = category
+        for name,value in encoding_options.items():
+            if name in solver.cnf_options:
+                setattr(solver,name,value)
+        backend = backends.get(category,backends.get(None))
+        if backend is not None:
+            solver.setBackend(backend)
+            if use_sessions and backend.incremental:
+                use_session(solver,backend)
+        result['time'],result['winner'] = check_solution(solver,solution,cnf_cache_dir,
+            result['log'].append,portfolio_configs)
+    except Exception as e:
+        result['error'] = (f'{json.dumps(object,indent=4)}\n'
+            f'ERROR ON THIS OBJECT = {type(e)}: {e}\n', traceback.format_exc())
+    return result
+
+def main():
+    global puzzle_dir, cnf_cache_dir
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument('file')
+    parser.add_argument('option',nargs='*')
+    parser.add_argument('--jobs',type=int,default=1)
+    parser.add_argument('--chunksize',type=int,default=8)
+    parser.add_argument('--cnf-cache',default=None)
+    parser.add_argument('--start',type=int,default=1)
+    parser.add_argument('--backend',action='append',default=[])
+    parser.add_argument('--no-sessions',action='store_true')
+    parser.add_argument('--portfolio',action='append',default=[])
+    parser.add_argument('--encoding',action='append',default=[])
+    args = parser.parse_args()
+    # worker processes are daemons, which cannot start portfolio processes
+    assert args.jobs == 1 or len(args.portfolio) == 0, '--portfolio requires --jobs 1'
+    assert args.start >= 1, '--start is numbered from 1'
+    portfolio_configs.extend(args.portfolio)
+    backend_specs = parse_backends(args.backend)
+    encodings = parse_encodings(args.encoding)
+    init_worker('',args.cnf_cache,backend_specs,not args.no_sessions,encodings)
+
+    # get part of filename before the .jsonl (and compression extension)
+    input_file = args.file
+    base,ext = os.path.splitext(input_file)
+    if ext in ('.gz','.xz'):
+        base,ext = os.path.splitext(base)
+    assert ext == '.jsonl'
+    puzzle_dir = os.path.basename(base)
+
+    sys.stderr.write(f'input_file = {input_file}\n')
+    sys.stderr.write(f'puzzle = {puzzle_dir}\n')
+
+    index = load_index(input_file)
+    sys.stderr.write(f'loaded {len(index)} objects\n')
+
+    if len(args.option) > 0: # extra option
+        option = args.option[0]
+        if option == 'list_params':
+            values = reduce(lambda x,y: x|y, (set(object['data'].keys()) for object in iter_objects(input_file,index)))
+            sys.stderr.write(f'parameters found = {values}\n')
+        elif option == 'list_param_values':
+            param = args.option[1]
+            values = set()
+            count_missing = 0
+            for object in iter_objects(input_file,index):
+                if param in object['data']:
+                    values.add(object['data'][param])
+                else:
+                    count_missing += 1
+            sys.stderr.write(f'values found for parameter {param} = {values}\n')
+            if count_missing > 0:
+                sys.stderr.write(f'counted {count_missing} objects without this parameter\n')
+        elif option == 'write_json':
+            sys.stderr.write(f'{json.dumps(read_object(input_file,index,int(args.option[1])-1),indent=4)}\n')
+        else:
+            sys.stderr.write(f'invalid option = {option}\n')
+        quit()
+
+    if parsers[puzzle_dir] is _not_implemented:
+        _not_implemented({})
+
+    global_start = time.perf_counter()
+    category2nums: dict[str,list[int]] = dict()
+    category2wins: dict[str,dict[str,int]] = dict()
+    skip_count = 0
+    sys.stderr.write('\n')
+    items = enumerate(iter_objects(input_file,index,args.start-1),args.start)
+    count = max(0,len(index)-args.start+1)
+    pool = None
+    if args.jobs > 1: # results arrive in completion order
+        # limit objects read ahead of the results so memory use stays constant
+        window = threading.Semaphore(4*args.jobs*args.chunksize)
+        stopped = threading.Event()
+        pool = multiprocessing.Pool(args.jobs,init_worker,
+            (puzzle_dir,cnf_cache_dir,backend_specs,use_sessions,encodings))
+        results = pool.imap_unordered(process_object,throttle(items,window,stopped),args.chunksize)
     else:
-        tqdm.write(f'processing object {i} = {object_file}')
-        try:
-            solver,solution,category = parsers[puzzle_dir](object['data'])
+        results = map(process_object,items)
+    for result in tqdm(results,total=count):
+        if pool is not None:
+            window.release()
+        for line in result['log']:
+            tqdm.write(line)
+        if result['error'] is not None:
+            message,trace = result['error']
+            sys.stderr.write(message)
+            sys.stderr.write(trace)
+            if pool is not None:
+                stopped.set()
+                pool.terminate()
+            quit()
+        if result['skipped']:
+            skip_count += 1
+        else:
+            category = result['category']
             if category not in category2nums:
                 category2nums[category] = []
-            category2nums[category].append(i)
-            check_solution(solver,solution,category)
-        except Exception as e:
-            sys.stderr.write(f'{json.dumps(object,indent=4)}\n')
-            sys.stderr.write(f'ERROR ON THIS OBJECT = {type(e)}: {e}\n')
-            traceback.print_exc()
-            quit()
-    tqdm.write('')
-global_time = time.perf_counter()-global_start
-sys.stderr.write('\n')
-sys.stderr.write(f'solved {len(objects)-skip_count} puzzles in {global_time} seconds\n')
-sys.stderr.write(f'average solving time is {global_time/len(objects)} seconds\n')
-sys.stderr.write('\n')
-
-for category in solving_times:
-    times = solving_times[category]
-    sys.stderr.write(f'category {category} ({len(times)} puzzles)\n')
-    sys.stderr.write(f'puzzles = {category2nums[category]}\n')
-    sys.stderr.write(f'min = {min(times)}\n')
-    sys.stderr.write(f'max = {max(times)}\n')
-    sys.stderr.write(f'avg = {sum(times)/len(times)}\n')
-    if len(times) >= 2:
-        sys.stderr.write(f'stddev = {stdev(times)}\n')
+            category2nums[category].append(result['i'])
+            if result['winner'] is not None:
+                wins = category2wins.setdefault(category,dict())
+                wins[result['winner']] = wins.get(result['winner'],0)+1
+            insert_timing(category,result['time'])
+        tqdm.write('')
+    if pool is not None:
+        pool.close()
+        pool.join()
+    global_time = time.perf_counter()-global_start
     sys.stderr.write('\n')
+    sys.stderr.write(f'solved {count-skip_count} puzzles in {global_time} seconds\n')
+    if count > 0:
+        sys.stderr.write(f'average solving time is {global_time/count} seconds\n')
+    sys.stderr.write('\n')
+
+    for category in solving_times:
+        times = solving_times[category]
+        sys.stderr.write(f'category {category} ({len(times)} puzzles)\n')
+        sys.stderr.write(f'puzzles = {category2nums[category]}\n')
+        sys.stderr.write(f'min = {min(times)}\n')
+        sys.stderr.write(f'max = {max(times)}\n')
+        sys.stderr.write(f'avg = {sum(times)/len(times)}\n')
+        if len(times) >= 2:
+            sys.stderr.write(f'stddev = {stdev(times)}\n')
+        if category in category2wins:
+            sys.stderr.write(f'portfolio wins = {category2wins[category]}\n')
+        sys.stderr.write('\n')
+
+class TestMain(unittest.TestCase):
+    ''' run with python3 -m unittest janko_solver '''
+    def _run(self, objects: list[dict[str,Any]], *args: str) -> subprocess.CompletedProcess:
+        with tempfile.TemporaryDirectory() as directory:
+            input_file = os.path.join(directory,'Sudoku.jsonl')
+            with open(input_file,'w') as f:
+                for object in objects:
+                    f.write(json.dumps(object)+'\n')
+            return subprocess.run([sys.executable,os.path.abspath(__file__),input_file,*args],
+                stdout=subprocess.PIPE,stderr=subprocess.STDOUT,text=True,timeout=30)
+    def test_compressed_start(self):
+        objects = [{'file': f'/Sudoku/{i}', 'data': {'i': i}} for i in range(20)]
+        data = b''.join(json.dumps(object).encode()+b'\n' for object in objects)
+        with tempfile.TemporaryDirectory() as directory:
+            for ext,compress in (('',bytes),('.gz',gzip.compress),('.xz',lzma.compress)):
+                input_file = os.path.join(directory,'Sudoku.jsonl'+ext)
+                with open(input_file,'wb') as f:
+                    f.write(compress(data))
+                index = load_index(input_file)
+                self.assertEqual(len(index),20)
+                self.assertEqual(list(iter_objects(input_file,index,15)),objects[15:])
+                self.assertEqual(list(iter_objects(input_file,index,20)),[])
+                self.assertEqual(read_object(input_file,index,7),objects[7])
+    def test_throttle(self):
+        window = threading.Semaphore(2)
+        stopped = threading.Event()
+        read: list[int] = []
+        reader = threading.Thread(target=lambda: read.extend(throttle(iter(range(10)),window,stopped)))
+        reader.start()
+        reader.join(0.5)
+        self.assertTrue(reader.is_alive()) # waiting for the window
+        window.release()
+        stopped.set()
+        reader.join(5)
+        self.assertFalse(reader.is_alive())
+        self.assertEqual(read,[0,1,2])
+    def test_error_with_jobs(self):
+        # many more objects than the read ahead window, all of them fail
+        objects = [{'file': f'/Sudoku/{i}', 'data': {}} for i in range(300)]
+        result = self._run(objects,'--jobs','2','--chunksize','1')
+        self.assertIn('ERROR ON THIS OBJECT',result.stdout)
+
+if __name__ == '__main__':
+    main()
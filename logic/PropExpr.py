@@ -1,182 +1,1072 @@
 '''
-Classes representing propositional logic expressions. These are all immutable.
+Classes representing propositional logic expressions. These are all immutable
+and hash consed: creating an expression equal to an existing one returns the
+existing object, so equal expressions are identical and share sub expressions.
+Each has a unique integer id (not reused while the program runs).
 '''
 
-from typing import Iterable, Union
+from itertools import count
+from typing import Any, Callable, Hashable, Iterable, Mapping, Optional, Sequence, Union
+import unittest
+from weakref import WeakValueDictionary
+
+from cnf_encodings import amo_encodings, card_sequential, sum_mdd, xor_chain
 
 _label_t = Union[str,int]
 
-class EXPR:
+_nodes: 'WeakValueDictionary[Hashable,EXPR]' = WeakValueDictionary() # _key() -> expression
+_next_id = count(1).__next__
+
+class _ExprType(type):
+    ''' metaclass returning the existing expression if an equal one exists '''
+    def __call__(cls, *args: Any):
+        expr = super().__call__(*args)
+        key = expr._key()
+        node = _nodes.get(key)
+        if node is None:
+            expr.id = _next_id()
+            node = _nodes[key] = expr
+        return node
+
+class EXPR(metaclass=_ExprType):
     ''' Base class, do not instantiate directly '''
+    __slots__ = ('exprs','id','_hash','__weakref__')
     def __init__(self, exprs: Iterable['EXPR'], min_length = 0, max_length = 255):
         '''
         Initialize a propositional logic expression.
         '''
         self.exprs = tuple(exprs)
         assert min_length <= len(self.exprs) <= max_length
+        h = hash(type(self))
+        for expr in self.exprs:
+            h += hash(expr)
+        self._hash = h % (2**61-1)
     def eval(self, values: dict[_label_t,bool]) -> bool:
         '''
         Evaluate a logic expression given a variable assignment.
         '''
         assert 0, 'not implemented'
         return False
-    def __eq__(self, other: 'EXPR') -> bool:
-        return isinstance(other,type(self)) and self.exprs == other.exprs
+    def _key(self) -> Hashable:
+        ''' equal expressions have equal keys (sub expressions are unique) '''
+        return (type(self),)+tuple(expr.id for expr in self.exprs)
+    def __eq__(self, other: object) -> bool:
+        return self is other
     def __hash__(self) -> int:
-        h = 0
-        for expr in self.exprs:
-            h += hash(expr)
-        h += hash(type(self))
-        return h % (2**61-1)
+        return self._hash
+    def __reduce__(self):
+        return (type(self),self.exprs)
     def __repr__(self) -> str:
         return f'{type(self).__name__}({",".join(repr(expr) for expr in self.exprs)})'
 
 class VAR(EXPR):
     ''' A single variable '''
+    __slots__ = ('label',)
     def __init__(self, label: _label_t):
         super().__init__([],0,0)
         self.label = label
+        self._hash = hash(label) % (2**61-1)
     def eval(self, values: dict[_label_t,bool]) -> bool:
         return values[self.label]
-    def __eq__(self, other: 'EXPR') -> bool:
-        return isinstance(other,type(self)) and self.label == other.label
-    def __hash__(self) -> int:
-        return hash(self.label) % (2**61-1)
+    def _key(self) -> Hashable:
+        return (VAR,type(self.label),self.label) # VAR(True) is not VAR(1)
+    def __reduce__(self):
+        return (VAR,(self.label,))
     def __repr__(self) -> str:
         return f'VAR({repr(self.label)})'
 
+class CONST(EXPR):
+    ''' A constant value (TRUE or FALSE) '''
+    __slots__ = ('value',)
+    def __init__(self, value: bool):
+        super().__init__([],0,0)
+        self.value = bool(value)
+        self._hash = hash((CONST,self.value)) % (2**61-1)
+    def eval(self, values: dict[_label_t,bool]) -> bool:
+        return self.value
+    def _key(self) -> Hashable:
+        return (CONST,self.value)
+    def __reduce__(self):
+        return (CONST,(self.value,))
+    def __repr__(self) -> str:
+        return 'TRUE' if self.value else 'FALSE'
+
+TRUE = CONST(True)
+FALSE = CONST(False)
+
 class NOT(EXPR):
+    __slots__ = ()
     def __init__(self, expr: EXPR):
         super().__init__([expr],1,1)
     def eval(self, values: dict[_label_t,bool]) -> bool:
         return not self.exprs[0].eval(values)
 
 class AND(EXPR):
+    __slots__ = ()
     def __init__(self, *exprs: EXPR):
         super().__init__(exprs,2)
     def eval(self, values: dict[_label_t,bool]) -> bool:
         return all(expr.eval(values) for expr in self.exprs)
 
 class OR(EXPR):
+    __slots__ = ()
     def __init__(self, *exprs: EXPR):
         super().__init__(exprs,2)
     def eval(self, values: dict[_label_t,bool]) -> bool:
         return any(expr.eval(values) for expr in self.exprs)
 
 class IF(EXPR):
+    __slots__ = ()
     def __init__(self, expr1: EXPR, expr2: EXPR):
         super().__init__([expr1,expr2],2,2)
     def eval(self, values: dict[_label_t,bool]) -> bool:
         return (not self.exprs[0].eval(values)) or self.exprs[1].eval(values)
 
 class IFF(EXPR):
+    __slots__ = ()
     def __init__(self, expr1: EXPR, expr2: EXPR):
         super().__init__([expr1,expr2],2,2)
     def eval(self, values: dict[_label_t,bool]) -> bool:
         return self.exprs[0].eval(values) == self.exprs[1].eval(values)
 
 class XOR(EXPR):
-    def __init__(self, expr1: EXPR, expr2: EXPR):
-        super().__init__([expr1,expr2],2,2)
+    ''' an odd number of the sub expressions are true '''
+    __slots__ = ()
+    def __init__(self, *exprs: EXPR):
+        super().__init__(exprs,2,len(exprs))
     def eval(self, values: dict[_label_t,bool]) -> bool:
-        return self.exprs[0].eval(values) != self.exprs[1].eval(values)
+        return sum(expr.eval(values) for expr in self.exprs)%2 == 1
 
-class XNOR(XOR): # same as IFF
-    def __init__(self, expr1: EXPR, expr2: EXPR):
-        super().__init__(expr1,expr2)
+class XNOR(XOR): # same as IFF for two
+    __slots__ = ()
+    def __init__(self, *exprs: EXPR):
+        super().__init__(*exprs)
     def eval(self, values: dict[_label_t,bool]) -> bool:
         return not super().eval(values)
 
 class NAND(AND):
+    __slots__ = ()
     def __init__(self, *exprs: EXPR):
         super().__init__(*exprs)
     def eval(self, values: dict[_label_t,bool]) -> bool:
         return not super().eval(values)
 
 class NOR(OR):
+    __slots__ = ()
     def __init__(self, *exprs: EXPR):
         super().__init__(*exprs)
     def eval(self, values: dict[_label_t,bool]) -> bool:
         return not super().eval(values)
 
-def _tseitin_mapper(expr: EXPR, var2expr: dict[int,EXPR], expr2var: dict[EXPR,int], next_var = 1) -> int:
-    ''' produce mapping of each (sub) expression to a variable number '''
-    if expr not in expr2var: # give expr a variable number
-        expr2var[expr] = next_var
-        var2expr[next_var] = expr
-        next_var += 1
-        for sub_expr in expr.exprs: # recursively apply to sub expressions
-            next_var = _tseitin_mapper(sub_expr,var2expr,expr2var,next_var)
-    return next_var
-
-def _tseitin_helper(expr: EXPR, expr2var: dict[EXPR,int], cnf: list[list[int]], done_exprs: set[int] = set()):
-    x = expr2var[expr]
-    if x in done_exprs:
-        return
-    ys = [expr2var[e] for e in expr.exprs]
+class CARD(EXPR):
+    ''' Base class of cardinality constraints, do not instantiate directly '''
+    __slots__ = ('k',)
+    def __init__(self, k: int, *exprs: EXPR):
+        super().__init__(exprs,0,len(exprs))
+        self.k = k
+        self._hash = (self._hash+hash(k)) % (2**61-1)
+    def bounds(self) -> tuple[int,int]:
+        ''' range of the number of true sub expressions '''
+        assert 0, 'not implemented'
+        return 0,0
+    def eval(self, values: dict[_label_t,bool]) -> bool:
+        lo,hi = self.bounds()
+        return lo <= sum(expr.eval(values) for expr in self.exprs) <= hi
+    def _key(self) -> Hashable:
+        return (type(self),self.k)+tuple(expr.id for expr in self.exprs)
+    def __reduce__(self):
+        return (type(self),(self.k,)+self.exprs)
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({",".join(repr(e) for e in (self.k,)+self.exprs)})'
+
+class ATMOST(CARD):
+    ''' at most k of the sub expressions are true '''
+    __slots__ = ()
+    def bounds(self) -> tuple[int,int]:
+        return 0,self.k
+
+class ATLEAST(CARD):
+    ''' at least k of the sub expressions are true '''
+    __slots__ = ()
+    def bounds(self) -> tuple[int,int]:
+        return self.k,len(self.exprs)
+
+class EXACTLY(CARD):
+    ''' exactly k of the sub expressions are true '''
+    __slots__ = ()
+    def bounds(self) -> tuple[int,int]:
+        return self.k,self.k
+
+class PBLE(EXPR):
+    ''' sum of the weights of the true sub expressions is at most k '''
+    __slots__ = ('k','weights')
+    def __init__(self, k: int, weights: Sequence[int], *exprs: EXPR):
+        super().__init__(exprs,0,len(exprs))
+        assert len(weights) == len(exprs)
+        self.k = k
+        self.weights = tuple(weights)
+        self._hash = (self._hash+hash((k,self.weights))) % (2**61-1)
+    def eval(self, values: dict[_label_t,bool]) -> bool:
+        return sum(w for w,expr in zip(self.weights,self.exprs) if expr.eval(values)) <= self.k
+    def _key(self) -> Hashable:
+        return (PBLE,self.k,self.weights)+tuple(expr.id for expr in self.exprs)
+    def __reduce__(self):
+        return (PBLE,(self.k,self.weights)+self.exprs)
+    def __repr__(self) -> str:
+        return f'PBLE({",".join(repr(e) for e in (self.k,self.weights)+self.exprs)})'
+
+def _tseitin_mapper(expr: EXPR) -> tuple[list[Optional[EXPR]],list[list[int]],list[int]]:
+    '''
+    number each distinct (sub) expression in preorder, starting from 1, returns
+    the expression for each number (index 0 unused), the numbers of the sub
+    expressions of each and the numbers in postorder (sub expressions first)
+    '''
+    var2expr: list[Optional[EXPR]] = [None]
+    expr2var: dict[int,int] = dict() # expression id -> number
+    postorder: list[int] = []
+    stack: list[tuple[EXPR,bool]] = [(expr,False)]
+    while stack:
+        expr,finished = stack.pop()
+        if finished:
+            postorder.append(expr2var[expr.id])
+        elif expr.id not in expr2var:
+            expr2var[expr.id] = len(var2expr)
+            var2expr.append(expr)
+            stack.append((expr,True))
+            stack.extend((sub_expr,False) for sub_expr in reversed(expr.exprs))
+    children = [[]]+[[expr2var[e.id] for e in expr.exprs] for expr in var2expr[1:]]
+    return var2expr,children,postorder
+
+def _tseitin_polarity(expr: EXPR, polarity: int) -> list[int]:
+    '''
+    polarity of each sub expression given the polarity of expr (1 for positive,
+    2 for negative, 3 for both)
+    '''
+    flipped = (polarity&1)<<1 | (polarity&2)>>1
+    if isinstance(expr,(NOT,NAND,NOR)):
+        return [flipped]*len(expr.exprs)
+    elif isinstance(expr,(AND,OR)):
+        return [polarity]*len(expr.exprs)
+    elif isinstance(expr,IF):
+        return [flipped,polarity]
+    elif isinstance(expr,ATMOST):
+        return [flipped]*len(expr.exprs)
+    elif isinstance(expr,ATLEAST):
+        return [polarity]*len(expr.exprs)
+    elif isinstance(expr,PBLE): # a larger weight makes it false
+        return [flipped if w > 0 else polarity for w in expr.weights]
+    else: # VAR, CONST (no sub expressions), IFF, XOR, XNOR, EXACTLY
+        return [3]*len(expr.exprs)
+
+def _tseitin_clauses(expr: EXPR, x: int, ys: list[int]) -> list[list[int]]:
+    '''
+    clauses for x <-> expr where ys are the variables for the sub expressions,
+    each starts with -x (x implies expr) or x (expr implies x)
+    '''
+    # subclasses before their base classes
     if isinstance(expr,VAR):
-        return
+        return []
+    elif isinstance(expr,CONST): # x <-> value
+        return [[x] if expr.value else [-x]]
     elif isinstance(expr,NOT): # x <-> not y
         y, = ys
-        cnf.append([-x,-y])
-        cnf.append([x,y])
+        return [[-x,-y],[x,y]]
+    elif isinstance(expr,NAND): # x <-> not y1 or not y2 or ...
+        return [[-x]+[-y for y in ys]]+[[x,y] for y in ys]
     elif isinstance(expr,AND): # x <-> y1 and y2 and ...
-        cnf.append([x]+[-y for y in ys])
-        for y in ys:
-            cnf.append([-x,y])
+        return [[-x,y] for y in ys]+[[x]+[-y for y in ys]]
+    elif isinstance(expr,NOR): # x <-> not y1 and not y2 and ...
+        return [[-x,-y] for y in ys]+[[x]+ys]
     elif isinstance(expr,OR): # x <-> y1 or y2 or ...
-        cnf.append([-x]+ys)
-        for y in ys:
-            cnf.append([x,-y])
+        return [[-x]+ys]+[[x,-y] for y in ys]
     elif isinstance(expr,IF): # x <-> (y -> z)
         y,z = ys
-        cnf.append([-x,-y,z])
-        cnf.append([x,y])
-        cnf.append([x,-z])
+        return [[-x,-y,z],[x,y],[x,-z]]
     elif isinstance(expr,IFF): # x <-> (y <-> z)
         y,z = ys
-        cnf.append([-x,-y,z])
-        cnf.append([-x,y,-z])
-        cnf.append([x,y,z])
-        cnf.append([x,-y,-z])
-    elif isinstance(expr,XOR): # x <-> (y ^ z)
-        y,z = ys
-        cnf.append([-x,y,z])
-        cnf.append([-x,-y,-z])
-        cnf.append([x,-y,z])
-        cnf.append([x,y,-z])
-    elif isinstance(expr,XNOR): # x <-> (y <-> z)
-        y,z = ys
-        cnf.append([-x,-y,z])
-        cnf.append([-x,y,-z])
-        cnf.append([x,y,z])
-        cnf.append([x,-y,-z])
-    elif isinstance(expr,NAND): # x <-> not y1 or not y2 or ...
-        cnf.append([-x]+[-y for y in ys])
-        for y in ys:
-            cnf.append([x,y])
-    elif isinstance(expr,NOR): # x <-> not y1 and not y2 and ...
-        cnf.append([x]+ys)
-        for y in ys:
-            cnf.append([-x,-y])
-    else:
-        assert 0, f'invalid expression type {type(expr)}'
-    done_exprs.add(x)
-    for sub_expr in expr.exprs:
-        _tseitin_helper(sub_expr,expr2var,cnf,done_exprs)
+        return [[-x,-y,z],[-x,y,-z],[x,y,z],[x,-y,-z]]
+    assert 0, f'invalid expression type {type(expr)}'
+    return []
 
-def tseitin_transform(expr: EXPR) -> tuple[list[list[int]],dict[int,EXPR]]:
+class _Guarded:
+    ''' appends clauses to cnf with guard added (so they only apply if guard is false) '''
+    def __init__(self, cnf: list[list[int]], guard: int):
+        self.cnf = cnf
+        self.guard = guard
+    def append(self, clause: Iterable[int]):
+        self.cnf.append([self.guard]+list(clause))
+
+def _tseitin_constraint(cnf: list[list[int]], expr: EXPR, x: int, ys: list[int], polarity: int,
+        new_var: Callable[[],int], amo_encoding: Optional[str], xor_cut: int):
+    '''
+    clauses for x <-> expr (a XOR, CARD or PBLE) where ys are the variables for
+    the sub expressions, encoding the constraint guarded by x and its negation
+    guarded by not x (for the polarity of expr) with cnf_encodings:
+    - XOR as the parity of ys and x with xor_chain (cut into pieces of xor_cut
+      sub expressions), only the last piece has x
+    - at most one (or exactly one) with amo_encoding, pairwise for up to 6 and
+      sequential for more sub expressions if None
+    - other cardinalities with card_sequential (sequential counter)
+    - PBLE with sum_mdd, each sub expression is a term with values 0 and weight
+    '''
+    n = len(ys)
+    if isinstance(expr,XOR): # even (odd for XNOR) with x
+        clauses: list[list[int]] = []
+        xor_chain(clauses,ys+[x],isinstance(expr,XNOR),new_var,xor_cut)
+        cnf.extend(c for c in clauses if (polarity & 2 if x in c else polarity & 1 if -x in c else True))
+        return
+    if isinstance(expr,PBLE):
+        terms = [{0: -y, w: y} for y,w in zip(ys,expr.weights) if w != 0]
+        lo = sum(min(term) for term in terms) # range of the sum
+        hi = sum(max(term) for term in terms)
+        if polarity & 1:
+            sum_mdd(_Guarded(cnf,-x),terms,lo,new_var,expr.k)
+        if polarity & 2:
+            sum_mdd(_Guarded(cnf,x),terms,expr.k+1,new_var,hi)
+        return
+    lo,hi = expr.bounds()
+    if polarity & 1:
+        if lo <= 1 and hi == 1:
+            if amo_encoding is None:
+                amo_encoding = 'pairwise' if n <= 6 else 'sequential'
+            amo_encodings[amo_encoding](_Guarded(cnf,-x),ys,new_var)
+            if lo == 1:
+                cnf.append([-x]+ys)
+        else:
+            card_sequential(_Guarded(cnf,-x),ys,lo,hi,new_var)
+    if polarity & 2: # fewer than lo or more than hi
+        outside = ([(0,lo-1)] if lo > 0 else [])+([(hi+1,n)] if hi < n else [])
+        if len(outside) == 0:
+            cnf.append([x])
+        elif len(outside) == 1:
+            card_sequential(_Guarded(cnf,x),ys,*outside[0],new_var)
+        else: # x or a or b, a implies fewer and b implies more
+            a,b = new_var(),new_var()
+            cnf.append([x,a,b])
+            card_sequential(_Guarded(cnf,-a),ys,*outside[0],new_var)
+            card_sequential(_Guarded(cnf,-b),ys,*outside[1],new_var)
+
+def tseitin_transform(expr: EXPR, polarity: bool = False, amo_encoding: Optional[str] = None,
+        xor_cut: int = 3) -> tuple[list[list[int]],list[Optional[EXPR]]]:
     '''
     Creates an equivalent CNF representation for a given propositional logic
     expression and a mapping of the variables in this CNF instance to
-    expressions or variables in the original expression.
+    expressions or variables in the original expression (a list, index 0 is
+    unused). With polarity, only the direction of each substitution needed for
+    the polarity its sub expression occurs with is used (Plaisted-Greenbaum),
+    which gives fewer clauses that are still satisfiable exactly when the
+    expression is, but the substitution variables are no longer equivalent.
+    XOR, cardinality and PBLE expressions use CNF encodings (see
+    _tseitin_constraint) with auxiliary variables numbered after the mapped
+    ones (from len of the mapping on).
     '''
-    # make map of (sub) expressions to CNF variables
-    var2expr: dict[int,EXPR] = dict()
-    expr2var: dict[EXPR,int] = dict()
-    _tseitin_mapper(expr,var2expr,expr2var)
+    # map (sub) expressions to CNF variables
+    var2expr,children,postorder = _tseitin_mapper(expr)
+    polarities = [3]*len(var2expr)
+    if polarity: # expr is positive, sub expressions get the union of their uses
+        polarities = [0]*len(var2expr)
+        polarities[1] = 1
+        for x in reversed(postorder): # each before its sub expressions
+            for y,p in zip(children[x],_tseitin_polarity(var2expr[x],polarities[x])):
+                polarities[y] |= p
     # start with the variable for the expression
-    cnf = [[expr2var[expr]]]
-    # conjunct substitutions for all sub exprs (exclude single vars)
-    _tseitin_helper(expr,expr2var,cnf)
+    cnf = [[1]]
+    # conjunct substitutions for all sub exprs (single vars have none)
+    new_var = count(len(var2expr)).__next__
+    for x in range(1,len(var2expr)):
+        if isinstance(var2expr[x],(XOR,CARD,PBLE)):
+            _tseitin_constraint(cnf,var2expr[x],x,children[x],polarities[x],new_var,amo_encoding,xor_cut)
+            continue
+        for clause in _tseitin_clauses(var2expr[x],x,children[x]):
+            if polarities[x] & (1 if clause[0] < 0 else 2):
+                cnf.append(clause)
     return cnf,var2expr
+
+def _xor_detect(cnf: Iterable[list[int]], max_size: int) -> list[tuple[list[int],int]]:
+    '''
+    XOR constraints (variables, parity) in cnf, a XOR of k variables is found
+    if all 2^(k-1) clauses excluding the sign patterns of the wrong parity are
+    there (with k <= max_size)
+    '''
+    groups: dict[tuple[int,...],set[int]] = dict() # variables -> excluded patterns
+    for clause in cnf:
+        variables = tuple(sorted(set(abs(v) for v in clause)))
+        if 0 < len(variables) <= max_size and len(variables) == len(clause):
+            # the clause excludes the assignment with every literal false
+            pattern = sum(1<<i for i,v in enumerate(variables) if -v in clause)
+            groups.setdefault(variables,set()).add(pattern)
+    result = []
+    for variables,patterns in groups.items():
+        if len(patterns) < 1<<(len(variables)-1):
+            continue
+        for parity in (0,1): # every pattern with the other parity excluded
+            if all(p in patterns for p in range(1<<len(variables)) if bin(p).count('1')%2 != parity):
+                result.append((list(variables),parity))
+    return result
+
+def _propagate(cnf: Iterable[list[int]], fixed: dict[int,bool], equivalent: dict[int,int]) \
+        -> Optional[list[list[int]]]:
+    '''
+    cnf with the variables in equivalent replaced by their literals and the
+    fixed values applied, with unit propagation (the units found are added to
+    fixed), None if a clause becomes empty. A queue of assigned literals and
+    the clauses each literal occurs in are used, so a clause is only visited
+    when one of its literals is assigned.
+    '''
+    clauses: list[list[int]] = []
+    queue = [v if value else -v for v,value in fixed.items()] # assigned, not propagated
+    for clause in cnf:
+        lits: list[int] = []
+        seen: set[int] = set()
+        for v in clause:
+            if abs(v) in equivalent:
+                v = equivalent[abs(v)] if v > 0 else -equivalent[abs(v)]
+            if -v in seen:
+                break
+            if v not in seen:
+                seen.add(v)
+                lits.append(v)
+        else: # not a tautology
+            if len(lits) == 0:
+                return None
+            elif len(lits) > 1:
+                clauses.append(lits)
+            elif abs(lits[0]) not in fixed:
+                fixed[abs(lits[0])] = lits[0] > 0
+                queue.append(lits[0])
+            elif fixed[abs(lits[0])] != (lits[0] > 0):
+                return None
+    occurrences: dict[int,list[int]] = dict() # literal -> clause numbers
+    for c,lits in enumerate(clauses):
+        for v in lits:
+            occurrences.setdefault(v,[]).append(c)
+    unassigned = [len(lits) for lits in clauses] # less the false literals propagated
+    satisfied = [False]*len(clauses)
+    while queue:
+        v = queue.pop()
+        for c in occurrences.get(v,()):
+            satisfied[c] = True
+        for c in occurrences.get(-v,()):
+            unassigned[c] -= 1
+            if satisfied[c] or unassigned[c] > 1:
+                continue
+            free = [] # at most 1, literals not propagated yet may be assigned
+            for w in clauses[c]:
+                if abs(w) not in fixed:
+                    free.append(w)
+                elif fixed[abs(w)] == (w > 0):
+                    satisfied[c] = True
+                    break
+            if satisfied[c]:
+                continue
+            if len(free) == 0:
+                return None
+            fixed[abs(free[0])] = free[0] > 0
+            queue.append(free[0])
+            satisfied[c] = True
+    return [[v for v in lits if abs(v) not in fixed]
+        for c,lits in enumerate(clauses) if not satisfied[c]]
+
+def xor_preprocess(cnf: Iterable[list[int]], max_size: int = 6) \
+        -> tuple[list[list[int]],list[int],list[tuple[int,int]]]:
+    '''
+    Finds the XOR constraints in a CNF (such as from tseitin_transform, up to
+    max_size variables, after unit propagation) and solves them together with
+    Gaussian elimination over GF(2), each row a bit set (int) of variables
+    with the parity in bit 0. Returns the reduced CNF, units and equivalences
+    (v,lit) where variable v equals literal lit of a remaining variable. The
+    reduced CNF has the units applied (and propagated) and each v replaced by
+    its lit, it is satisfiable exactly when cnf is ([[]] if not) and a model of
+    it gives a model of cnf with the units and equivalences.
+
+    The clauses of a XOR implied by the XORs found before it (its row is
+    eliminated to 0) are removed. The other XOR clauses are kept, since only
+    units and equivalences are taken from the eliminated rows (not rows of more
+    variables), those of XORs reduced to units or equivalences disappear when
+    these are substituted.
+    '''
+    fixed: dict[int,bool] = dict()
+    equivalent: dict[int,int] = dict()
+    reduced = _propagate(cnf,fixed,equivalent)
+    if reduced is None:
+        return [[]],[],[]
+    columns: dict[int,int] = dict() # variable -> bit
+    variables: list[int] = [0] # variable for each bit
+    pivots: dict[int,int] = dict() # lowest variable bit -> row
+    implied: dict[tuple[int,...],int] = dict() # XOR variables -> parity
+    for xor_vars,parity in _xor_detect(reduced,max_size):
+        row = parity
+        for v in xor_vars:
+            if v not in columns:
+                columns[v] = 1<<len(variables)
+                variables.append(v)
+            row |= columns[v]
+        for bit,pivot_row in pivots.items():
+            if row & bit:
+                row ^= pivot_row
+        if row == 1: # 0 = 1
+            return [[]],[],[]
+        if row == 0:
+            implied[tuple(xor_vars)] = parity
+            continue
+        bit = (row>>1 & -(row>>1))<<1
+        for other in pivots:
+            if pivots[other] & bit:
+                pivots[other] ^= row
+        pivots[bit] = row
+    for bit,row in pivots.items(): # pivot variables only appear in their row
+        others = row & ~bit & ~1
+        v = variables[bit.bit_length()-1]
+        if others == 0:
+            fixed[v] = row & 1 == 1
+        elif others & (others-1) == 0: # one other variable
+            w = variables[others.bit_length()-1]
+            equivalent[v] = -w if row & 1 else w
+    if implied: # a clause of a XOR excludes an assignment of the other parity
+        reduced = [clause for clause in reduced if len(clause) != len(set(map(abs,clause)))
+            or implied.get(tuple(sorted(map(abs,clause)))) != sum(v < 0 for v in clause)%2^1]
+    reduced = _propagate(reduced,fixed,equivalent)
+    if reduced is None:
+        return [[]],[],[]
+    units = [v if value else -v for v,value in sorted(fixed.items())]
+    return reduced,units,sorted(equivalent.items())
+
+def _compiled_op(expr: EXPR, args: list[str]) -> str:
+    '''
+    Python expression for expr on bit patterns, args are the expressions of
+    its sub expressions and m has all bits set (true in every bit)
+    '''
+    # subclasses before their base classes
+    if isinstance(expr,CONST):
+        return 'm' if expr.value else '0'
+    elif isinstance(expr,NOT):
+        return f'{args[0]}^m'
+    elif isinstance(expr,NAND):
+        return f'({"&".join(args)})^m'
+    elif isinstance(expr,AND):
+        return '&'.join(args)
+    elif isinstance(expr,NOR):
+        return f'({"|".join(args)})^m'
+    elif isinstance(expr,OR):
+        return '|'.join(args)
+    elif isinstance(expr,IF):
+        return f'({args[0]}^m)|{args[1]}'
+    elif isinstance(expr,IFF):
+        return f'({"^".join(args)})^m'
+    elif isinstance(expr,XOR): # a long ^ chain nests too deep to compile
+        xor = '^'.join(args) if len(args) <= 255 else f'_parity([{",".join(args)}])'
+        return f'({xor})^m' if isinstance(expr,XNOR) else xor
+    elif isinstance(expr,CARD):
+        return f'_count_range(m,[{",".join(args)}],{",".join(map(str,expr.bounds()))})'
+    elif isinstance(expr,PBLE):
+        return f'_pb_le(m,[{",".join(args)}],{expr.weights},{expr.k})'
+    assert 0, f'invalid expression type {type(expr)}'
+    return ''
+
+def _count_range(m: int, ys: list[int], lo: int, hi: int) -> int:
+    ''' bits where the number of ys with the bit set is in lo..hi '''
+    n = len(ys)
+    if lo > hi or lo > n or hi < 0:
+        return 0
+    top = min(max(lo,hi+1),n)
+    s = [m]+[0]*top # s[j] = bits where at least j are set
+    for y in ys:
+        for j in range(top,0,-1):
+            s[j] |= s[j-1]&y
+    result = s[max(lo,0)]
+    if hi < n:
+        result &= s[hi+1]^m
+    return result
+
+def _parity(ys: list[int]) -> int:
+    ''' bits set in an odd number of ys '''
+    result = 0
+    for y in ys:
+        result ^= y
+    return result
+
+def _pb_le(m: int, ys: list[int], weights: tuple[int,...], k: int) -> int:
+    ''' bits where the sum of the weights of the ys with the bit set is at most k '''
+    sums = {0: m} # partial sum -> bits with that sum
+    for y,w in zip(ys,weights):
+        next_sums: dict[int,int] = dict()
+        for s,bits in sums.items():
+            for t,b in ((s,bits&~y),(s+w,bits&y)):
+                if b:
+                    next_sums[t] = next_sums.get(t,0)|b
+        sums = next_sums
+    result = 0
+    for s,bits in sums.items():
+        if s <= k:
+            result |= bits
+    return result
+
+class CompiledExpr:
+    '''
+    An expression compiled to a Python function of the values of its variables
+    (in slots numbered by labels), evaluating each distinct sub expression once
+    without recursion. Values are bit patterns so that one call evaluates as
+    many assignments as there are bits (bit j of each value is assignment j).
+    All variables must have values, the results then match EXPR.eval.
+    '''
+    def __init__(self, expr: EXPR):
+        self.expr = expr
+        var2expr,children,postorder = _tseitin_mapper(expr)
+        self.labels: list[_label_t] = [] # label of each slot
+        lines = ['def f(v,m):']
+        for x in postorder:
+            sub_expr = var2expr[x]
+            if isinstance(sub_expr,VAR):
+                lines.append(f' t{x}=v[{len(self.labels)}]')
+                self.labels.append(sub_expr.label)
+            else:
+                lines.append(f' t{x}={_compiled_op(sub_expr,[f"t{y}" for y in children[x]])}')
+        lines.append(' return t1')
+        self.code = '\n'.join(lines)
+        namespace: dict[str,Any] = {'_count_range': _count_range, '_parity': _parity, '_pb_le': _pb_le}
+        exec(self.code,namespace)
+        self.func: Callable[[Sequence[int],int],int] = namespace['f']
+    def eval(self, values: Mapping[_label_t,bool]) -> bool:
+        ''' evaluate for one assignment '''
+        return self.func([int(values[label]) for label in self.labels],1) == 1
+    def eval_packed(self, words: Sequence[int], width: int) -> int:
+        '''
+        evaluate width assignments, words[i] has bit j set if the variable in
+        slot i is true in assignment j, bit j of the result is the value for
+        assignment j
+        '''
+        return self.func(words,(1<<width)-1)
+    def eval_batch(self, assignments: Sequence[Mapping[_label_t,bool]]) -> list[bool]:
+        ''' evaluate for many assignments at once '''
+        n = len(assignments)
+        if n == 0:
+            return []
+        words = [int(''.join('1' if a[label] else '0' for a in reversed(assignments)),2)
+            for label in self.labels]
+        result = format(self.eval_packed(words,n),f'0{n}b')
+        return [b == '1' for b in reversed(result)]
+
+def expr_size(expr: EXPR) -> tuple[int,int]:
+    ''' number of distinct (sub) expressions and clauses from tseitin_transform '''
+    cnf,var2expr = tseitin_transform(expr)
+    return len(var2expr)-1,len(cnf)
+
+def _simplify_subs(expr: EXPR, negated: int) -> list[tuple[EXPR,int]]:
+    ''' (sub expression, negated) needed to simplify expr (negated if 1) '''
+    if isinstance(expr,NOT):
+        return [(expr.exprs[0],1-negated)]
+    elif isinstance(expr,(NAND,NOR)):
+        return [(e,1-negated) for e in expr.exprs]
+    elif isinstance(expr,(AND,OR)):
+        return [(e,negated) for e in expr.exprs]
+    elif isinstance(expr,IF):
+        return [(expr.exprs[0],1-negated),(expr.exprs[1],negated)]
+    elif isinstance(expr,(IFF,XOR)): # both of each leaf (including XNOR)
+        return [(e,n) for e in _xor_cone(expr)[1] for n in (0,1)]
+    elif isinstance(expr,(CARD,PBLE)): # negated with the bounds
+        return [(e,0) for e in expr.exprs]
+    return [] # VAR, CONST
+
+def _xor_cone(expr: EXPR) -> tuple[int,list[EXPR]]:
+    '''
+    (parity, leaves) with expr (a XOR, XNOR or IFF) equal to the XOR of the
+    leaves, negated if parity is 1. Nested XOR, XNOR, IFF, NOT and constants
+    are expanded, each once: the number of times a node occurs is counted
+    (modulo 2) from the nodes using it, so even ones cancel. Leaves are in the
+    order they are first reached.
+    '''
+    first: dict[int,int] = dict() # id -> order of first visit
+    postorder: list[EXPR] = []
+    stack: list[tuple[EXPR,bool]] = [(expr,False)]
+    while stack:
+        e,expanded = stack.pop()
+        if expanded:
+            postorder.append(e)
+        elif e.id not in first:
+            first[e.id] = len(first)
+            if isinstance(e,(XOR,IFF,NOT)):
+                stack.append((e,True))
+                stack.extend((s,False) for s in reversed(e.exprs) if s.id not in first)
+            else:
+                postorder.append(e)
+    odd = {expr.id} # ids occurring an odd number of times
+    parity = 0
+    leaves: list[EXPR] = []
+    for e in reversed(postorder): # users before the nodes they use
+        if e.id not in odd:
+            continue
+        if isinstance(e,CONST):
+            parity ^= e.value
+        elif isinstance(e,(XOR,IFF,NOT)):
+            parity ^= isinstance(e,(XNOR,IFF,NOT))
+            for s in e.exprs:
+                odd ^= {s.id}
+        else:
+            leaves.append(e)
+    leaves.sort(key=lambda e: first[e.id])
+    return parity, leaves
+
+def _complement(expr: EXPR) -> Optional[EXPR]:
+    ''' the simplified negation of a simplified expression if it is simple '''
+    if isinstance(expr,VAR):
+        return NOT(expr)
+    elif isinstance(expr,NOT):
+        return expr.exprs[0]
+    elif type(expr) is XOR:
+        return IFF(*expr.exprs) if len(expr.exprs) == 2 else XNOR(*expr.exprs)
+    elif type(expr) in (IFF,XNOR):
+        return XOR(*expr.exprs)
+    return None
+
+def _simplify_junction(args: list[EXPR], conjunction: bool) -> EXPR:
+    ''' AND (or OR) of simplified expressions '''
+    op,unit,zero = (AND,TRUE,FALSE) if conjunction else (OR,FALSE,TRUE)
+    children: list[EXPR] = []
+    ids: set[int] = set()
+    for arg in args:
+        for expr in (arg.exprs if type(arg) is op else (arg,)): # flatten
+            if expr is zero:
+                return zero
+            if expr is not unit and expr.id not in ids:
+                ids.add(expr.id)
+                children.append(expr)
+    for expr in children:
+        if (c := _complement(expr)) is not None and c.id in ids:
+            return zero
+    if len(children) == 0:
+        return unit
+    while len(children) > 255: # too many sub expressions for one node
+        children = [op(*children[i:i+255]) if i+1 < len(children) else children[i]
+            for i in range(0,len(children),255)]
+    return children[0] if len(children) == 1 else op(*children)
+
+def _simplify_xor(args: list[EXPR], negated: int) -> EXPR:
+    '''
+    XOR (XNOR if negated) of simplified expressions, args has each followed by
+    its negation. XOR, XNOR and IFF are flattened (they are already flat, so
+    one level), constants and NOT removed (changing the parity) and pairs of
+    equal sub expressions or an expression and its negation cancelled.
+    '''
+    negations = {a.id: not_a for a,not_a in zip(args[::2],args[1::2])}
+    odd: dict[int,EXPR] = dict() # sub expressions occurring an odd number of times
+    pending = args[-2::-2] # in order when popped
+    while pending:
+        expr = pending.pop()
+        if isinstance(expr,CONST):
+            negated ^= expr.value
+        elif isinstance(expr,NOT):
+            negated ^= 1
+            pending.append(expr.exprs[0])
+        elif isinstance(expr,(XOR,IFF)):
+            negated ^= isinstance(expr,(XNOR,IFF))
+            pending.extend(reversed(expr.exprs))
+        elif expr.id in odd:
+            del odd[expr.id]
+        else:
+            odd[expr.id] = expr
+    for expr in list(odd.values()):
+        not_expr = negations.get(expr.id)
+        if expr.id in odd and not_expr is not None and not_expr.id in odd:
+            del odd[expr.id],odd[not_expr.id]
+            negated ^= 1
+    children = list(odd.values())
+    if len(children) == 0:
+        return CONST(negated)
+    elif len(children) == 1:
+        if not negated:
+            return children[0]
+        expr = children[0]
+        return negations.get(expr.id) or _complement(expr) or simplify(NOT(expr))
+    if len(children) == 2:
+        return IFF(*children) if negated else XOR(*children)
+    return XNOR(*children) if negated else XOR(*children)
+
+def _simplify_card(args: list[EXPR], lo: int, hi: int) -> EXPR:
+    ''' number of true simplified expressions is in lo..hi '''
+    children: list[EXPR] = []
+    for arg in args:
+        if isinstance(arg,CONST):
+            lo,hi = lo-arg.value,hi-arg.value
+        else:
+            children.append(arg)
+    n = len(children)
+    lo,hi = max(lo,0),min(hi,n)
+    if lo > hi:
+        return FALSE
+    elif lo == 0 and hi == n:
+        return TRUE
+    elif lo == n:
+        return _simplify_junction(children,True)
+    elif lo == 1 and hi == n:
+        return _simplify_junction(children,False)
+    elif lo == hi:
+        return EXACTLY(lo,*children)
+    elif lo == 0:
+        return ATMOST(hi,*children)
+    elif hi == n:
+        return ATLEAST(lo,*children)
+    return _simplify_junction([ATLEAST(lo,*children),ATMOST(hi,*children)],True)
+
+def _simplify_pb(args: list[EXPR], weights: Iterable[int], k: int) -> EXPR:
+    ''' sum of the weights of the true simplified expressions is at most k '''
+    terms: dict[int,list] = dict() # id -> [expression, total weight]
+    for arg,w in zip(args,weights):
+        if isinstance(arg,CONST):
+            k -= w if arg.value else 0
+        else:
+            terms.setdefault(arg.id,[arg,0])[1] += w
+    children = [(e,w) for e,w in terms.values() if w != 0]
+    if sum(max(w,0) for _,w in children) <= k:
+        return TRUE
+    elif sum(min(w,0) for _,w in children) > k:
+        return FALSE
+    return PBLE(k,[w for _,w in children],*(e for e,_ in children))
+
+def _simplify_node(expr: EXPR, negated: int, args: list[EXPR]) -> EXPR:
+    ''' simplify expr (negated if 1) given the results for _simplify_subs '''
+    if isinstance(expr,VAR):
+        return NOT(expr) if negated else expr
+    elif isinstance(expr,CONST):
+        return CONST(expr.value != bool(negated))
+    elif isinstance(expr,NOT):
+        return args[0]
+    elif isinstance(expr,(NAND,OR,IF)): # NOR is an OR
+        conjunction = negated == (0 if isinstance(expr,NOR) else 1)
+        return _simplify_junction(args,conjunction)
+    elif isinstance(expr,AND):
+        return _simplify_junction(args,negated == 0)
+    elif isinstance(expr,(IFF,XOR)): # args are for the leaves
+        return _simplify_xor(args,negated^_xor_cone(expr)[0])
+    elif isinstance(expr,CARD):
+        lo,hi = expr.bounds()
+        if not negated:
+            return _simplify_card(args,lo,hi)
+        return _simplify_junction([_simplify_card(args,0,lo-1),_simplify_card(args,hi+1,len(args))],False)
+    elif isinstance(expr,PBLE): # not (sum <= k) is (-sum <= -k-1)
+        if not negated:
+            return _simplify_pb(args,expr.weights,expr.k)
+        return _simplify_pb(args,(-w for w in expr.weights),-expr.k-1)
+    assert 0, f'invalid expression type {type(expr)}'
+    return expr
+
+def simplify(expr: EXPR, stats: Optional[dict[str,int]] = None) -> EXPR:
+    '''
+    Returns an equivalent expression to use with tseitin_transform, with only
+    AND, OR, XOR, IFF, XNOR of more than two, cardinality, PBLE, NOT of a
+    variable, variables and constants:
+    - negations are pushed down to the variables (negation normal form, XOR
+      and IFF or XNOR swapping), IF, NAND, NOR and XNOR of two are written
+      with these
+    - XOR, XNOR and IFF are flattened into one XOR or XNOR and pairs of equal
+      sub expressions cancelled
+    - AND and OR are flattened and duplicate sub expressions removed
+    - AND is FALSE (OR is TRUE) if it has a sub expression and its negation
+    - constants are folded away (unless the result is a constant)
+    - cardinality and PBLE constraints are negated by changing their bounds,
+      trivial ones are replaced (such as ATLEAST 1 by OR), PBLE sub expressions
+      are merged and those with weight 0 removed
+    If stats is given, nodes and clauses are set to the number of distinct sub
+    expressions and clauses from tseitin_transform saved (negative if more).
+    '''
+    memo: dict[tuple[int,int],EXPR] = dict() # (id, negated) -> simplified
+    stack: list[tuple[EXPR,int,bool]] = [(expr,0,False)]
+    while stack:
+        e,negated,expanded = stack.pop()
+        if (e.id,negated) in memo:
+            continue
+        subs = _simplify_subs(e,negated)
+        if expanded:
+            memo[e.id,negated] = _simplify_node(e,negated,[memo[s.id,n] for s,n in subs])
+        else: # sub expressions first
+            stack.append((e,negated,True))
+            stack.extend((s,n,False) for s,n in reversed(subs) if (s.id,n) not in memo)
+    result = memo[expr.id,0]
+    if stats is not None:
+        nodes,clauses = expr_size(expr)
+        nodes_after,clauses_after = expr_size(result)
+        stats['nodes'] = nodes-nodes_after
+        stats['clauses'] = clauses-clauses_after
+    return result
+
+class TestTseitin(unittest.TestCase):
+    def _random_expr(self, rng, labels: list[str], depth: int) -> EXPR:
+        if depth == 0 or rng.random() < 0.2:
+            return CONST(rng.random() < 0.5) if rng.random() < 0.05 else VAR(rng.choice(labels))
+        t = rng.choice([NOT,AND,OR,IF,IFF,XOR,XNOR,NAND,NOR,ATMOST,ATLEAST,EXACTLY,PBLE])
+        if t in (ATMOST,ATLEAST,EXACTLY,PBLE):
+            n = rng.randint(0,4)
+            exprs = [self._random_expr(rng,labels,depth-1) for _ in range(n)]
+            if t is PBLE:
+                return PBLE(rng.randint(-3,4),[rng.randint(-3,3) for _ in range(n)],*exprs)
+            return t(rng.randint(-1,n+1),*exprs)
+        elif t in (AND,OR,NAND,NOR,XOR,XNOR):
+            return t(*(self._random_expr(rng,labels,depth-1) for _ in range(rng.randint(2,3))))
+        elif t is NOT:
+            return t(self._random_expr(rng,labels,depth-1))
+        return t(self._random_expr(rng,labels,depth-1),self._random_expr(rng,labels,depth-1))
+    def test_transform(self):
+        import pycosat
+        import random
+        from itertools import product
+        rng = random.Random(1)
+        labels = ['a','b','c','d']
+        for _ in range(200):
+            expr = self._random_expr(rng,labels,4)
+            for polarity in (False,True):
+                cnf,var2expr = tseitin_transform(expr,polarity)
+                label2var = {e.label: v for v,e in enumerate(var2expr) if isinstance(e,VAR)}
+                for values in product([False,True],repeat=len(label2var)):
+                    assignment = dict(zip(label2var,values))
+                    units = [[v if assignment[k] else -v] for k,v in label2var.items()]
+                    sat = pycosat.solve(cnf+units) != 'UNSAT'
+                    self.assertEqual(expr.eval(assignment),sat,f'{expr} {assignment}')
+    def test_constraints(self):
+        import pycosat
+        from itertools import product
+        vs = [VAR(i) for i in range(8)]
+        for amo_encoding in [None]+list(amo_encodings):
+            for k in range(-1,4):
+                for t in (ATMOST,ATLEAST,EXACTLY):
+                    for polarity in (False,True):
+                        for expr in (t(k,*vs[:6]),NOT(t(k,*vs[:6]))):
+                            cnf,var2expr = tseitin_transform(expr,polarity,amo_encoding)
+                            for values in product([False,True],repeat=6):
+                                units = [[var2expr.index(vs[i]) if v else -var2expr.index(vs[i])]
+                                    for i,v in enumerate(values)]
+                                sat = pycosat.solve(cnf+units) != 'UNSAT'
+                                self.assertEqual(expr.eval(dict(enumerate(values))),sat,f'{expr}')
+        self.assertEqual(len(tseitin_transform(EXACTLY(1,*vs),True)[0]),1+20+1) # sequential AMO
+        expr = PBLE(5,[1,2,3,-2],*vs[:4])
+        self.assertIs(simplify(ATLEAST(1,vs[0],vs[1],FALSE)),OR(vs[0],vs[1]))
+        self.assertIs(simplify(NOT(expr)),PBLE(-6,[-1,-2,-3,2],*vs[:4]))
+        self.assertIs(simplify(PBLE(2,[1,1,2],vs[0],vs[0],vs[1])),PBLE(2,[2,2],vs[0],vs[1]))
+    def test_xor_preprocess(self):
+        import pycosat
+        import random
+        rng = random.Random(4)
+        vs = [VAR(i) for i in range(10)]
+        for _ in range(100):
+            constraints = []
+            for _ in range(rng.randint(1,8)):
+                t = rng.choice([XOR,XNOR,XOR,OR])
+                constraints.append(t(*rng.sample(vs,rng.randint(2,6))))
+            expr = AND(*constraints) if len(constraints) > 1 else constraints[0]
+            cnf,var2expr = tseitin_transform(expr,rng.random() < 0.5)
+            reduced,units,equivalences = xor_preprocess(cnf)
+            model = pycosat.solve(reduced)
+            self.assertEqual(pycosat.solve(cnf) == 'UNSAT',model == 'UNSAT' or reduced == [[]],f'{expr}')
+            if model == 'UNSAT' or reduced == [[]]:
+                continue
+            values = {abs(v): v > 0 for v in model+units}
+            for v,lit in equivalences:
+                values[v] = values.get(abs(lit),False) == (lit > 0)
+            self.assertTrue(all(any(values.get(abs(v),False) == (v > 0) for v in c) for c in cnf),f'{expr}')
+        a,b,c,d = vs[:4] # a != b = c, d is a xor c xor 1 so false
+        cnf,var2expr = tseitin_transform(AND(XOR(a,b),XNOR(b,c),XOR(a,c,d)))
+        xa,xb,xc,xd = (var2expr.index(e) for e in (a,b,c,d))
+        reduced,units,equivalences = xor_preprocess(cnf)
+        self.assertEqual((reduced,units[-1],equivalences),([],-xd,[(xa,-xc),(xb,xc)]))
+        self.assertEqual(xor_preprocess(tseitin_transform(AND(XOR(a,b),XOR(b,c),XOR(c,a)))[0])[0],[[]])
+        # clauses of a XOR implied by the others are removed, the others stay
+        cnf = []
+        for lits,parity in (([1,2,3],True),([3,4,5],False),([1,2,4,5],True)):
+            xor_chain(cnf,lits,parity,lambda: 0,len(lits)) # no new variables
+        reduced,units,equivalences = xor_preprocess(cnf+[[1,4],[-1,-2,6]])
+        self.assertEqual((len(reduced),units,equivalences),(10,[],[]))
+        self.assertEqual(set(map(frozenset,reduced)),set(map(frozenset,cnf[:8]+[[1,4],[-1,-2,6]])))
+        n = 5000 # long implication chain (propagation is linear)
+        self.assertEqual(xor_preprocess([[-i,i+1] for i in range(n,0,-1)]+[[1]]),([],list(range(1,n+2)),[]))
+        self.assertEqual(xor_preprocess([[-2],[-1,2],[1]])[0],[[]])
+    def test_compiled(self):
+        import random
+        from itertools import product
+        rng = random.Random(2)
+        labels = ['a','b','c','d']
+        for _ in range(200):
+            expr = self._random_expr(rng,labels,4)
+            compiled = CompiledExpr(expr)
+            assignments = [dict(zip(labels,values)) for values in product([False,True],repeat=4)]
+            expected = [expr.eval(a) for a in assignments]
+            self.assertEqual([compiled.eval(a) for a in assignments],expected,f'{expr}')
+            self.assertEqual(compiled.eval_batch(assignments),expected,f'{expr}')
+    def test_simplify(self):
+        import random
+        from itertools import product
+        rng = random.Random(3)
+        labels = ['a','b','c','d']
+        assignments = [dict(zip(labels,values)) for values in product([False,True],repeat=4)]
+        allowed = (VAR,CONST,AND,OR,XOR,IFF,XNOR,ATMOST,ATLEAST,EXACTLY,PBLE)
+        for _ in range(300):
+            expr = self._random_expr(rng,labels,5)
+            result = simplify(expr)
+            compiled = CompiledExpr(result)
+            self.assertEqual([compiled.eval(a) for a in assignments],[expr.eval(a) for a in assignments],f'{expr} {result}')
+            stack = [result]
+            while stack:
+                e = stack.pop()
+                self.assertTrue(type(e) in allowed or type(e) is NOT and isinstance(e.exprs[0],VAR),f'{result}')
+                stack.extend(e.exprs)
+        a,b,c = VAR('a'),VAR('b'),VAR('c')
+        self.assertIs(simplify(AND(AND(a,b),c,NOT(NOT(a)))),AND(a,b,c))
+        self.assertIs(simplify(OR(a,NAND(a,b))),TRUE)
+        self.assertIs(simplify(XNOR(NOT(a),AND(b,TRUE))),XOR(a,b))
+        self.assertIs(simplify(NOR(IF(a,b),c)),AND(a,NOT(b),NOT(c)))
+        stats: dict[str,int] = dict()
+        self.assertIs(simplify(NOT(NOT(AND(AND(a,b),c))),stats),AND(a,b,c))
+        self.assertEqual(stats,{'nodes': 3, 'clauses': 6})
+    def test_interning(self):
+        import pickle
+        a,b = VAR('a'),VAR('b')
+        self.assertIs(VAR('a'),a)
+        self.assertIs(AND(VAR('a'),NOT(b)),AND(a,NOT(VAR('b'))))
+        self.assertIsNot(AND(a,b),NAND(a,b))
+        self.assertIsNot(AND(a,b),AND(b,a))
+        self.assertNotEqual(XOR(a,b).id,XNOR(a,b).id)
+        self.assertIs(pickle.loads(pickle.dumps(IF(a,b))),IF(a,b))
+        self.assertFalse(hasattr(a,'__dict__'))
+        self.assertIsNot(VAR(True),VAR(1))
+        self.assertIsNot(VAR(1.0),VAR(1))
+        self.assertIs(VAR(True).label,True)
+        self.assertIs(VAR(1),VAR(1))
+    def test_long_xor(self):
+        import pycosat
+        xs = [VAR(i) for i in range(1000)]
+        for op in (XOR,XNOR):
+            expr = op(*xs)
+            self.assertEqual(len(expr.exprs),1000)
+            self.assertIs(simplify(expr),expr)
+            compiled = CompiledExpr(expr)
+            values = [{i: i in (3,500) or i < k for i in range(1000)} for k in (0,1,2)]
+            self.assertEqual(compiled.eval_batch(values),[expr.eval(v) for v in values])
+            cnf,var2expr = tseitin_transform(expr)
+            for k in (0,1,2): # fix the values of the first three variables
+                units = [[x if var2expr[x].label < k else -x] for x in range(1,len(var2expr))
+                    if isinstance(var2expr[x],VAR) and var2expr[x].label != 999]
+                model = set(pycosat.solve(cnf+units+[[1]]))
+                x999 = var2expr.index(VAR(999))
+                self.assertEqual(x999 in model,(k%2 == 0) == (op is XOR))
+    def test_deep(self):
+        expr: EXPR = VAR('a')
+        for i in range(10000):
+            expr = NOT(expr) if i % 2 else AND(expr,VAR(i))
+        cnf,var2expr = tseitin_transform(expr)
+        self.assertEqual(len(var2expr),15002)
+        self.assertEqual(len(cnf),25001)
+        cnf,var2expr = tseitin_transform(expr,True)
+        self.assertEqual(len(cnf),12501)
+        self.assertEqual(expr_size(expr),(15001,25001))
+        self.assertEqual(expr_size(simplify(expr)),(12501,20001)) # AND and OR instead of NOT
+        xor: EXPR = VAR(0) # a XOR chain is flattened in linear time
+        for i in range(1,10000):
+            xor = (XOR(xor,VAR(i)),XNOR(NOT(xor),VAR(i)),IFF(VAR(i),NOT(xor)))[i%3]
+        xor = simplify(xor)
+        self.assertIs(type(xor),XOR)
+        self.assertEqual(sorted(e.label for e in xor.exprs),list(range(10000)))
+        xa,xb,xc = VAR('a'),VAR('b'),VAR('c') # shared nodes cancel
+        self.assertIs(simplify(XOR(XOR(XOR(xa,xb),xc),XNOR(xa,xb))),NOT(xc))
+        compiled = CompiledExpr(expr) # a if all others are true, true if 9998 is false
+        self.assertEqual(compiled.eval_batch([{i: True for i in range(0,9999,2)} | {'a': a, 9998: b}
+            for a,b in [(False,True),(True,True),(False,False)]]),[False,True,True])
+
+if __name__ == '__main__':
+    unittest.main()
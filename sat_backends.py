@@ -0,0 +1,244 @@
+'''
+SAT solver backends for solving CNFs (a CnfBuffer or a list of clauses). A
+backend is selected with a spec string (see get_backend):
+- pycosat: PicoSAT through the pycosat package (default)
+- pysat:<name>: a solver from the python-sat package if it is installed, such
+  as pysat:cadical195, pysat:glucose4 or pysat:minisat22
+- dimacs:<command>: an executable that reads a DIMACS file given as the last
+  argument and prints the result in the SAT competition format (s and v lines),
+  such as dimacs:kissat -q
+'''
+
+from itertools import chain
+import os
+import shlex
+import subprocess
+import tempfile
+from typing import Iterable, Iterator, Optional
+import unittest
+import pycosat
+
+from cnf_utils import CnfBuffer, cnf_stats, cnf_write
+
+class SatSession:
+    '''
+    Solves one CNF many times with different assumptions (literals that must
+    be true) and temporary extra clauses, such as the structural clauses of a
+    puzzle geometry with the givens of each puzzle as assumptions. This version
+    solves from scratch each time, sessions of incremental backends keep one
+    solver (with its learned clauses) for all calls.
+    '''
+    def __init__(self, backend: 'SatBackend', cnf: Iterable[Iterable[int]]):
+        self.backend = backend
+        self.cnf = cnf
+    def solve(self, assumptions: Iterable[int] = (), extra: Iterable[Iterable[int]] = ()) -> Optional[list[int]]:
+        '''
+        like SatBackend.solve, the extra clauses apply to this call only and
+        may only use variables of the session CNF
+        '''
+        return self.backend.solve(self.cnf,chain(([v] for v in assumptions),extra))
+    def close(self):
+        ''' release the solver '''
+        pass
+
+class SatBackend:
+    '''
+    Base class for a SAT solver backend. Must override solve. The default
+    itersolve finds each next solution by solving again with clauses excluding
+    the previous solutions, subclasses may override it with something better.
+    Backends with incremental solving override session and set incremental.
+    '''
+    spec = ''
+    incremental = False
+    def solve(self, cnf: Iterable[Iterable[int]], extra: Iterable[Iterable[int]] = ()) -> Optional[list[int]]:
+        '''
+        Solves cnf with the extra clauses added. Returns a list of nonzero
+        integers (+n for n true and -n for n false), None if unsatisfiable.
+        '''
+        assert 0, 'not implemented'
+    def itersolve(self, cnf: Iterable[Iterable[int]]) -> Iterator[list[int]]:
+        ''' iterator of all solutions to cnf '''
+        blocking: list[list[int]] = []
+        while (result := self.solve(cnf,blocking)) is not None:
+            yield result
+            blocking.append([-v for v in result])
+    def session(self, cnf: Iterable[Iterable[int]]) -> SatSession:
+        ''' start a session for solving cnf with assumptions '''
+        return SatSession(self,cnf)
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.spec!r})'
+
+class PycosatBackend(SatBackend):
+    ''' PicoSAT (through pycosat) '''
+    spec = 'pycosat'
+    def solve(self, cnf: Iterable[Iterable[int]], extra: Iterable[Iterable[int]] = ()) -> Optional[list[int]]:
+        result = pycosat.solve(chain(cnf,extra))
+        assert result != 'UNKNOWN'
+        return None if result == 'UNSAT' else result
+    def itersolve(self, cnf: Iterable[Iterable[int]]) -> Iterator[list[int]]:
+        return pycosat.itersolve(cnf)
+
+class PysatSession(SatSession):
+    '''
+    Session keeping one python-sat solver. Extra clauses are added with a new
+    activation literal a as (not a or clause) and a is assumed for that call,
+    afterwards the unit clause (not a) disables them permanently. Activation
+    literals are numbered after the CNF variables, so a variable first used in
+    extra clauses could be one of them.
+    '''
+    def __init__(self, backend: 'PysatBackend', cnf: Iterable[Iterable[int]]):
+        if not isinstance(cnf,(list,CnfBuffer)):
+            cnf = list(cnf)
+        self.backend = backend
+        self.cnf = cnf
+        self.variables = cnf_stats(cnf)[0]
+        self.top = self.variables # highest variable used
+        self.solver = backend._load(cnf)
+    def solve(self, assumptions: Iterable[int] = (), extra: Iterable[Iterable[int]] = ()) -> Optional[list[int]]:
+        assumptions = list(assumptions)
+        extra = [list(clause) for clause in extra]
+        if len(extra) == 0:
+            return self.solver.get_model() if self.solver.solve(assumptions=assumptions) else None
+        assert all(abs(v) <= self.variables for c in extra for v in c), \
+            'extra clauses use variables not in the session CNF'
+        self.top += 1
+        act = self.top
+        for clause in extra:
+            self.solver.add_clause([-act]+clause)
+        result = self.solver.get_model() if self.solver.solve(assumptions=assumptions+[act]) else None
+        self.solver.add_clause([-act])
+        return result
+    def close(self):
+        self.solver.delete()
+
+class PysatBackend(SatBackend):
+    ''' a solver from python-sat, name is as used by pysat.solvers.Solver '''
+    incremental = True
+    def __init__(self, name: str):
+        from pysat.solvers import Solver, SolverNames
+        assert any(name in names for names in vars(SolverNames).values()
+            if isinstance(names,tuple)), f'unknown pysat solver {name}'
+        self.spec = f'pysat:{name}'
+        self.name = name
+        self._solver_class = Solver
+    def _load(self, cnf: Iterable[Iterable[int]]):
+        solver = self._solver_class(name=self.name)
+        solver.append_formula(cnf)
+        return solver
+    def solve(self, cnf: Iterable[Iterable[int]], extra: Iterable[Iterable[int]] = ()) -> Optional[list[int]]:
+        with self._load(chain(cnf,extra)) as solver:
+            return solver.get_model() if solver.solve() else None
+    def itersolve(self, cnf: Iterable[Iterable[int]]) -> Iterator[list[int]]:
+        with self._load(cnf) as solver:
+            yield from solver.enum_models()
+    def session(self, cnf: Iterable[Iterable[int]]) -> SatSession:
+        return PysatSession(self,cnf)
+
+class DimacsBackend(SatBackend):
+    '''
+    An external solver executable, the CNF is written to a temporary DIMACS
+    file whose path is appended to the command. The exit code (10 for SAT, 20
+    for UNSAT) or the s line gives the result and the v lines the solution.
+    '''
+    def __init__(self, command: str):
+        self.spec = f'dimacs:{command}'
+        self.command = shlex.split(command)
+        assert len(self.command) > 0, 'empty solver command'
+    def solve(self, cnf: Iterable[Iterable[int]], extra: Iterable[Iterable[int]] = ()) -> Optional[list[int]]:
+        extra = list(extra)
+        if isinstance(cnf,(list,CnfBuffer)):
+            variables,clauses = cnf_stats(cnf)
+        else: # count the clauses first
+            cnf = list(cnf)
+            variables,clauses = cnf_stats(cnf)
+        variables = max(variables,max((abs(v) for c in extra for v in c),default=0))
+        fd,path = tempfile.mkstemp(suffix='.cnf')
+        try:
+            with os.fdopen(fd,'wb') as f:
+                cnf_write(f,chain(cnf,extra),variables,clauses+len(extra))
+            proc = subprocess.run(self.command+[path],stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,text=True)
+        finally:
+            os.remove(path)
+        status = None
+        values: list[int] = []
+        for line in proc.stdout.splitlines():
+            if line.startswith('s '):
+                status = line[2:].strip()
+            elif line.startswith('v '):
+                values.extend(int(v) for v in line[2:].split())
+        if status is None:
+            status = {10: 'SATISFIABLE', 20: 'UNSATISFIABLE'}.get(proc.returncode)
+        assert status in ('SATISFIABLE','UNSATISFIABLE'), \
+            f'{self.command[0]} failed (exit code {proc.returncode}, status {status})'
+        if status == 'UNSATISFIABLE':
+            return None
+        # same form as pycosat, all variables in order (unlisted are false)
+        result = [-v for v in range(1,variables+1)]
+        for v in values:
+            if 0 < abs(v) <= variables:
+                result[abs(v)-1] = v
+        return result
+
+def get_backend(spec: str) -> SatBackend:
+    ''' create the backend for a spec string (see module docstring) '''
+    kind,_,arg = spec.partition(':')
+    if kind == 'pycosat':
+        return PycosatBackend()
+    elif kind == 'pysat':
+        return PysatBackend(arg)
+    elif kind == 'dimacs':
+        return DimacsBackend(arg)
+    assert 0, f'unknown backend {spec}'
+
+def available_backends() -> list[str]:
+    ''' specs of pycosat and some common python-sat solvers that can be used '''
+    result = ['pycosat']
+    try:
+        from pysat.solvers import Solver
+    except ImportError:
+        return result
+    for name in ['cadical195','cadical153','glucose4','minisat22','maplesat','lingeling']:
+        try:
+            Solver(name=name).delete()
+            result.append(f'pysat:{name}')
+        except Exception: # not compiled into this python-sat build
+            pass
+    return result
+
+class TestSession(unittest.TestCase):
+    # exactly one of 1, 2, 3
+    cnf = [[1,2,3],[-1,-2],[-1,-3],[-2,-3]]
+    def _sessions(self):
+        for spec in available_backends():
+            backend = get_backend(spec)
+            session = backend.session(self.cnf)
+            self.assertEqual(isinstance(session,PysatSession),backend.incremental)
+            yield spec, session
+    def _true(self, model):
+        self.assertIsNotNone(model)
+        return [v for v in (1,2,3) if v in model]
+    def test_assumptions(self):
+        for spec,session in self._sessions():
+            with self.subTest(spec=spec):
+                self.assertEqual(self._true(session.solve([1])),[1])
+                self.assertEqual(self._true(session.solve([-1,-2])),[3])
+                self.assertIsNone(session.solve([1,2]))
+                self.assertEqual(self._true(session.solve([2])),[2])
+                self.assertEqual(len(self._true(session.solve())),1)
+            session.close()
+    def test_extra(self):
+        for spec,session in self._sessions():
+            with self.subTest(spec=spec):
+                self.assertEqual(self._true(session.solve((),[[-1],[-2]])),[3])
+                self.assertEqual(self._true(session.solve([1])),[1])
+                self.assertIsNone(session.solve([3],[[-3,1]]))
+                self.assertEqual(self._true(session.solve([3])),[3])
+                self.assertIsNone(session.solve((),[[-1],[-2],[-3]]))
+                self.assertEqual(self._true(session.solve([2],[[2,3]])),[2])
+                if isinstance(session,PysatSession): # 4 is an activation literal
+                    self.assertRaises(AssertionError,session.solve,(),[[4]])
+            session.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,73 @@
-from typing import Any, Iterator
-import pycosat
+import ast
+from functools import lru_cache
+import hashlib
+import inspect
+from itertools import islice
+import multiprocessing
+import os
+import queue
+import re
+import time
+from typing import Any, Iterable, Iterator, Optional, Union
+import unittest
+
+import cnf_encodings
+import cnf_utils
+from cnf_utils import CnfBuffer, cnf_load_binary, cnf_save_binary, cnf_shuffle
+from sat_backends import PycosatBackend, SatBackend, SatSession, get_backend
+
+def _canonical(value: Any) -> Any:
+    ''' convert puzzle state to a form with a deterministic repr '''
+    if isinstance(value,dict):
+        return tuple(sorted((_canonical(k),_canonical(v)) for k,v in value.items()))
+    if isinstance(value,(set,frozenset)):
+        return tuple(sorted(_canonical(v) for v in value))
+    if isinstance(value,(list,tuple)):
+        return tuple(_canonical(v) for v in value)
+    return value
+
+@lru_cache(maxsize=None)
+def _source_hash(cls: type) -> str:
+    '''
+    hash of the source files of a class and its base classes, and of the
+    modules with the shared encoders and the CNF container
+    '''
+    h = hashlib.sha256()
+    for obj in cls.__mro__[:-1]+(cnf_encodings,cnf_utils): # exclude object
+        with open(inspect.getfile(obj),'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def _parse_config(config: str) -> tuple[str,dict[str,Any]]:
+    '''
+    split a portfolio configuration BACKEND[,name=value ...] into the backend
+    spec and the settings (values are Python literals or strings)
+    '''
+    settings: dict[str,Any] = dict()
+    while (m := re.search(r',(\w+)=([^,=]*)$',config)):
+        try:
+            settings[m[1]] = ast.literal_eval(m[2])
+        except (ValueError,SyntaxError):
+            settings[m[1]] = m[2]
+        config = config[:m.start()]
+    return config, settings
+
+def _portfolio_run(puzzle: 'SatPuzzleBase', config: str, method: str, args: tuple,
+        results: multiprocessing.Queue, i: int):
+    ''' process for one portfolio configuration, puts (i,success,result) '''
+    try:
+        backend,settings = _parse_config(config)
+        puzzle.setSession(None)
+        puzzle.setBackend(backend)
+        seed = settings.pop('seed',None)
+        for name,value in settings.items():
+            assert name in puzzle.cnf_options, f'unknown option {name}'
+            setattr(puzzle,name,value)
+        if seed is not None:
+            puzzle._cnf = cnf_shuffle(puzzle.getCnf(),seed)
+        results.put((i,True,getattr(puzzle,method)(*args)))
+    except Exception as e:
+        results.put((i,False,f'{config}: {type(e).__name__}: {e}'))
 
 class SatPuzzleBase:
     '''
@@ -8,39 +76,186 @@ class SatPuzzleBase:
     - toSol: convert the solution to the SAT problem back to the puzzle solution
     The other functions extend the functionality of these and should not need to
     be overridden by subclasses.
+
+    The CNF is built at most once per instance (see getCnf). Assigning to a
+    public attribute drops the cached CNF so it is rebuilt on the next use.
+    Changing puzzle state in place (such as appending to a list attribute)
+    after the CNF was built requires calling invalidateCnf.
+
+    The SAT solver is pycosat unless another backend (see sat_backends) is set
+    with setBackend for one instance or setDefaultBackend for a class.
+
+    Puzzles sharing all clauses except for some unit clauses (such as givens)
+    can be solved in one incremental session (see sessionKey and setSession).
+    A portfolio of configurations can also be raced in separate processes.
     '''
-    def toCnf(self) -> list[list[int]]:
+    # names of class attributes (options) that change the encoding
+    cnf_options: tuple[str,...] = ()
+    _backend: SatBackend = PycosatBackend()
+    _session: Optional[SatSession] = None
+    # configuration -> number of times it was the first to finish in portfolio
+    portfolio_wins: dict[str,int] = dict()
+    def __setattr__(self, name: str, value: Any):
+        if not name.startswith('_'): # puzzle state changed, cached CNF is stale
+            self.invalidateCnf()
+        super().__setattr__(name,value)
+    def toCnf(self) -> Union[CnfBuffer,list[list[int]]]:
         '''
         Convert puzzle to a CNF logic expression. The return value is a list of
         clauses similar to the DIMACS CNF format. Each clause is a list of
         nonzero integers (+n for variable n and -n for the negation of variable
         n). The value 0 should not be included, it is simply the clause
         terminator for the DIMACS CNF format and is not necessary for this list
-        of lists representation.
+        of lists representation. Returning a CnfBuffer (which supports append
+        and extend like a list) is preferred since it is much more compact.
         '''
         assert 0, 'not implemented'
-        return []
+        return CnfBuffer()
     def toSol(self, satSol: list[int]) -> Any:
         '''
         Convert a solution to the CNF SAT instance into a puzzle solution. The
         type returned should be determined by the subclass.
         '''
         assert 0, 'not implemented'
+    def solLits(self, sol: Any) -> Optional[list[int]]:
+        '''
+        Inverse of toSol, the literals (of the variables for the puzzle cells)
+        that are true for a puzzle solution. None if the solution cannot be
+        represented (for example a value that the encoding excludes). This is
+        needed for solveUnique and verifySolution.
+        '''
+        assert 0, 'not implemented'
+    def finishCnf(self, cnf: CnfBuffer) -> CnfBuffer:
+        '''
+        Called by getCnf with the complete result of self.toCnf() (including
+        all subclass extensions) to allow a final rewrite of the CNF. The
+        default returns it unchanged.
+        '''
+        return cnf
+    def getCnf(self) -> CnfBuffer:
+        '''
+        Returns the CNF from self.toCnf() as a CnfBuffer, building it only on
+        the first call after construction or invalidation. The result is shared,
+        so it should not be modified by the caller.
+        '''
+        if '_cnf' not in self.__dict__:
+            cnf = self.toCnf()
+            self._cnf = self.finishCnf(cnf if isinstance(cnf,CnfBuffer) else CnfBuffer(cnf))
+        return self._cnf
+    def cnfStats(self) -> tuple[int,int]:
+        '''
+        Returns (number of variables, number of clauses) of the cached CNF.
+        '''
+        cnf = self.getCnf()
+        return cnf.variables, len(cnf)
+    def cnfHash(self) -> str:
+        '''
+        Content hash identifying the CNF of this puzzle, computed from the
+        public attributes, the encoding options and the source code of the
+        class and of cnf_encodings and cnf_utils (so changes to an encoding do
+        not reuse old files).
+        '''
+        state = {k: v for k,v in self.__dict__.items() if not k.startswith('_')}
+        options = {name: getattr(self,name) for name in self.cnf_options}
+        data = repr((type(self).__qualname__,_canonical(state),_canonical(options)))
+        h = hashlib.sha256(data.encode())
+        h.update(_source_hash(type(self)).encode())
+        return h.hexdigest()
+    def cachedCnf(self, directory: str) -> CnfBuffer:
+        '''
+        Like getCnf, but the CNF is stored in the binary format in the given
+        directory (named by cnfHash) and loaded from there when it exists, so
+        later runs (or other processes) skip encoding the puzzle.
+        '''
+        if '_cnf' not in self.__dict__:
+            path = os.path.join(directory,self.cnfHash()+'.cnfb')
+            if os.path.exists(path):
+                self._cnf = cnf_load_binary(path)
+            else:
+                os.makedirs(directory,exist_ok=True)
+                cnf_save_binary(path,self.getCnf())
+        return self._cnf
+    def iterCnf(self) -> tuple[int,int,Iterator[Iterable[int]]]:
+        '''
+        Returns (number of variables, number of clauses, iterator of clauses)
+        for writing the CNF without holding all of it (see cnf_utils.cnf_write).
+        The default iterates over getCnf(). Subclasses with large CNFs may
+        override this to generate clauses lazily, the clause count must be
+        exact and the variable count may be an upper bound.
+        '''
+        cnf = self.getCnf()
+        return cnf.variables, len(cnf), iter(cnf)
+    def invalidateCnf(self):
+        '''
+        Discard the cached CNF. This is done automatically when a public
+        attribute is assigned but must be called after in place changes.
+        '''
+        self.__dict__.pop('_cnf',None)
+    def setBackend(self, backend: Union[str,SatBackend]):
+        '''
+        Select the SAT solver for this puzzle, a SatBackend or a spec string
+        (see sat_backends.get_backend).
+        '''
+        self._backend = get_backend(backend) if isinstance(backend,str) else backend
+    @classmethod
+    def setDefaultBackend(cls, backend: Union[str,SatBackend]):
+        '''
+        Select the SAT solver for all puzzles of this class (and subclasses)
+        that do not have their own, SatPuzzleBase.setDefaultBackend(...) sets
+        it for all puzzles.
+        '''
+        cls._backend = get_backend(backend) if isinstance(backend,str) else backend
+    def sessionKey(self) -> Optional[tuple]:
+        '''
+        Puzzles with equal keys have the same sessionCnf, so one session can
+        solve all of them. None (the default) if sessions are not supported.
+        '''
+        return None
+    def sessionCnf(self) -> Union[CnfBuffer,list[list[int]]]:
+        '''
+        The CNF without the sessionAssumptions (should not be modified).
+        '''
+        assert 0, 'not implemented'
+    def sessionAssumptions(self) -> list[int]:
+        '''
+        Literals which together with sessionCnf are equivalent to getCnf.
+        '''
+        assert 0, 'not implemented'
+    def newSession(self) -> SatSession:
+        '''
+        Start a session with the selected backend for puzzles with this
+        sessionKey. It keeps learned clauses between puzzles if the backend is
+        incremental (otherwise each puzzle is still solved from scratch).
+        '''
+        assert self.sessionKey() is not None, 'sessions not supported'
+        return self._backend.session(self.sessionCnf())
+    def setSession(self, session: Optional[SatSession]):
+        '''
+        Solve with a session from newSession of a puzzle with the same
+        sessionKey, or stop using one (None). The session is not closed.
+        '''
+        self._session = session
     def cnfSolve(self) -> list[int]:
         '''
-        Solves the CNF problem returned by self.toCnf(). Currently, pycosat
-        (Python3 package for PicoSAT) is used. The return value is a list of
-        nonzero integers (+n for n true and -n for n false), or the empty list
-        if no solution is found.
+        Solves the CNF problem returned by self.getCnf() with the selected
+        backend (pycosat by default). The return value is a list of nonzero
+        integers (+n for n true and -n for n false), or the empty list if no
+        solution is found.
+        '''
+        result = self._solve()
+        return [] if result is None else result
+    def _solve(self, extra: Iterable[Iterable[int]] = ()) -> Optional[list[int]]:
+        '''
+        Solves the CNF with some extra clauses added, None if unsatisfiable.
         '''
-        result = pycosat.solve(self.toCnf())
-        assert result != 'UNKNOWN'
-        return [] if result == 'UNSAT' else result
+        if self._session is not None:
+            return self._session.solve(self.sessionAssumptions(),extra)
+        return self._backend.solve(self.getCnf(),extra)
     def cnfSolveAll(self) -> Iterator[list[int]]:
         '''
         Finds all solutions to the CNF problem, returning an iterator of them.
         '''
-        return pycosat.itersolve(self.toCnf())
+        return self._backend.itersolve(self.getCnf())
     def solve(self) -> Any:
         '''
         Finds a solution to the logic puzzle. Currently, an exception should
@@ -52,3 +267,211 @@ class SatPuzzleBase:
         Returns an iterator of all solutions to the logic puzzle.
         '''
         return map(self.toSol,self.cnfSolveAll())
+    def solveUnique(self) -> tuple[str,Any]:
+        '''
+        Finds a solution and checks if it is the only one by solving again with
+        a clause excluding its cell values, so at most 2 solutions are found.
+        Returns (status,solution), status is 'none' (solution is None),
+        'unique' or 'multiple' (solution is the first found).
+        '''
+        model = self._solve()
+        if model is None:
+            return 'none', None
+        sol = self.toSol(model)
+        lits = self.solLits(sol)
+        assert lits is not None
+        other = self._solve([[-v for v in lits]])
+        return ('unique' if other is None else 'multiple'), sol
+    def verifySolution(self, sol: Any) -> str:
+        '''
+        Checks a known solution is the unique solution. Usually decided by the
+        first 2 models (differing in all variables), otherwise by solving with
+        its cell values as unit clauses and with a clause excluding them.
+        Returns 'invalid', 'unique' or 'multiple'.
+        '''
+        lits = self.solLits(sol)
+        if lits is None:
+            return 'invalid'
+        if self._session is not None:
+            if self._session.solve(self.sessionAssumptions()+lits) is None:
+                return 'invalid'
+            return 'unique' if self._solve([[-v for v in lits]]) is None else 'multiple'
+        models = list(map(self.toSol,islice(self.cnfSolveAll(),2)))
+        if models == [sol]:
+            return 'unique'
+        if len(models) == 2 and sol in models and models[0] != models[1]:
+            return 'multiple'
+        if self._solve([v] for v in lits) is None:
+            return 'invalid'
+        return 'unique' if self._solve([[-v for v in lits]]) is None else 'multiple'
+    def portfolio(self, configs: list[str], method: str, *args: Any,
+            timeout: Optional[float] = None) -> tuple[Any,str]:
+        '''
+        Runs getattr(puzzle,method)(*args) (such as 'verifySolution') for each
+        configuration at the same time, each in a separate process with its
+        own copy of this puzzle. The first result is returned (with the winning
+        configuration, also counted in portfolio_wins) and the other processes
+        are terminated. A configuration is BACKEND[,name=value ...] with the
+        backend spec (see sat_backends.get_backend) and settings, which are
+        seed (solve the CNF with clauses shuffled by cnf_utils.cnf_shuffle)
+        or encoding options from cnf_options. For example:
+        ['pycosat','pysat:cadical195,seed=1','pysat:glucose4,domain_encoding=True']
+        Raises TimeoutError if no configuration finishes within timeout
+        seconds. Errors in a configuration (including its process exiting
+        without a result) are ignored unless all fail.
+        '''
+        assert len(configs) > 0
+        # fork shares the puzzle and its CNF without pickling them
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        results = context.Queue()
+        processes = [context.Process(target=_portfolio_run,daemon=True,
+            args=(self,config,method,args,results,i)) for i,config in enumerate(configs)]
+        for process in processes:
+            process.start()
+        deadline = None if timeout is None else time.monotonic()+timeout
+        errors: dict[int,str] = dict() # failed configurations
+        exited: set[int] = set() # found dead without a result at the last poll
+        try:
+            while len(errors) < len(configs):
+                # poll so processes dying without a result (killed by a signal,
+                # out of memory) are noticed
+                wait = 0.1 if deadline is None else min(0.1,max(0,deadline-time.monotonic()))
+                try:
+                    i,success,result = results.get(timeout=wait)
+                except queue.Empty:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise TimeoutError(f'portfolio timed out after {timeout} seconds')
+                    for i,process in enumerate(processes):
+                        if i in errors or process.is_alive():
+                            continue
+                        if i in exited: # a result sent before exiting was read by now
+                            errors[i] = f'{configs[i]}: exited with code {process.exitcode} without a result'
+                        exited.add(i)
+                    continue
+                if success:
+                    winner = configs[i]
+                    SatPuzzleBase.portfolio_wins[winner] = SatPuzzleBase.portfolio_wins.get(winner,0)+1
+                    return result, winner
+                errors[i] = result
+            assert 0, 'all portfolio configurations failed:\n' + '\n'.join(errors.values())
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join()
+            results.close()
+
+class TestCnfCache(unittest.TestCase):
+    def _puzzle(self):
+        from . import SatPuzzleSudokuStandard
+        return SatPuzzleSudokuStandard(2,2,[[1,0,0,0],[0,0,1,0],[0,0,0,0],[0,0,0,0]])
+    def test_cached(self):
+        puzzle = self._puzzle()
+        cnf = puzzle.getCnf()
+        self.assertIs(puzzle.getCnf(),cnf)
+        puzzle._unrelated = 1 # private attributes keep the CNF
+        self.assertIs(puzzle.getCnf(),cnf)
+    def test_assign(self):
+        for domain_encoding in (False,True):
+            puzzle = self._puzzle()
+            puzzle.domain_encoding = domain_encoding
+            cnf = puzzle.getCnf()
+            puzzle.givens = [1,2,3,4,3,4,1,2,2,1,4,3,4,3,2,1]
+            self.assertIsNot(puzzle.getCnf(),cnf)
+            self.assertEqual(puzzle.solveUnique(),('unique',[[1,2,3,4],[3,4,1,2],[2,1,4,3],[4,3,2,1]]))
+    def test_options(self):
+        puzzle = self._puzzle()
+        cnf = puzzle.getCnf()
+        puzzle.domain_encoding = True
+        domain_cnf = puzzle.getCnf()
+        self.assertIsNot(domain_cnf,cnf)
+        self.assertLess(len(domain_cnf),len(cnf))
+        puzzle.amo_encoding = 'sequential'
+        self.assertIsNot(puzzle.getCnf(),domain_cnf)
+    def test_in_place(self):
+        puzzle = self._puzzle()
+        cnf = puzzle.getCnf()
+        puzzle.givens[1] = 1 # not noticed until invalidated
+        self.assertIs(puzzle.getCnf(),cnf)
+        puzzle.invalidateCnf()
+        self.assertEqual(puzzle.solveUnique(),('none',None))
+
+class TestSolveUnique(unittest.TestCase):
+    solution = [[1,2,3,4],[3,4,1,2],[2,1,4,3],[4,3,2,1]]
+    def _puzzles(self, givens):
+        # the dense encoding (also solved in a session) and the domain encoding
+        from . import SatPuzzleSudokuStandard
+        for domain_encoding,session in ((False,False),(False,True),(True,False)):
+            puzzle = SatPuzzleSudokuStandard(2,2,givens)
+            puzzle.domain_encoding = domain_encoding
+            if session:
+                puzzle.setSession(puzzle.newSession())
+            yield puzzle
+    def test_unique(self):
+        for puzzle in self._puzzles([[0,0,0,0],[0,0,1,2],[0,1,0,3],[0,3,2,0]]):
+            self.assertEqual(puzzle.solveUnique(),('unique',self.solution))
+            self.assertEqual(puzzle.verifySolution(self.solution),'unique')
+    def test_multiple(self):
+        other = [[1,2,3,4],[3,4,1,2],[4,3,2,1],[2,1,4,3]]
+        for puzzle in self._puzzles([[1,2,0,0],[0,0,0,0],[0,0,0,0],[0,0,0,0]]):
+            status,sol = puzzle.solveUnique()
+            self.assertEqual(status,'multiple')
+            self.assertIn(tuple(map(tuple,sol)),set(tuple(map(tuple,s)) for s in puzzle.solveAll()))
+            self.assertEqual(puzzle.verifySolution(self.solution),'multiple')
+            self.assertEqual(puzzle.verifySolution(other),'multiple')
+    def test_invalid(self):
+        wrong_given = [[2,1,3,4],[3,4,1,2],[1,2,4,3],[4,3,2,1]] # valid sudoku
+        repeated = [[1,2,3,4],[3,4,1,2],[2,1,4,3],[4,3,1,2]]
+        for puzzle in self._puzzles([[1,2,0,0],[0,0,0,0],[0,0,0,0],[0,0,0,0]]):
+            self.assertEqual(puzzle.verifySolution(wrong_given),'invalid')
+            self.assertEqual(puzzle.verifySolution(repeated),'invalid')
+            self.assertEqual(puzzle.verifySolution([[1,2,3,4]]),'invalid')
+    def test_unsatisfiable(self):
+        for puzzle in self._puzzles([[1,2,0,0],[0,0,3,0],[0,0,0,3],[0,0,0,0]]):
+            self.assertEqual(puzzle.solveUnique(),('none',None))
+            self.assertEqual(puzzle.verifySolution(self.solution),'invalid')
+
+class TestPortfolio(unittest.TestCase):
+    solution = [[1,2,3,4],[3,4,1,2],[2,1,4,3],[4,3,2,1]]
+    def _puzzle(self):
+        from . import SatPuzzleSudokuStandard
+        return SatPuzzleSudokuStandard(2,2,[[0,0,0,0],[0,0,1,2],[0,1,0,3],[0,3,2,0]])
+    def test_winner(self):
+        configs = ['pycosat','pycosat,seed=1','pycosat,domain_encoding=True']
+        puzzle = self._puzzle()
+        wins = sum(puzzle.portfolio_wins.get(config,0) for config in configs)
+        result,winner = puzzle.portfolio(configs,'verifySolution',self.solution)
+        self.assertEqual(result,'unique')
+        self.assertIn(winner,configs)
+        self.assertEqual(sum(puzzle.portfolio_wins.get(config,0) for config in configs),wins+1)
+        result,winner = puzzle.portfolio(configs,'solveUnique')
+        self.assertEqual(result,('unique',self.solution))
+    def test_failed(self):
+        puzzle = self._puzzle()
+        # a failing configuration does not stop the others
+        self.assertEqual(puzzle.portfolio(['pycosat,unknown=1','pycosat'],'solveUnique'),
+            (('unique',self.solution),'pycosat'))
+        with self.assertRaisesRegex(AssertionError,'unknown option'):
+            puzzle.portfolio(['pycosat,unknown=1','pycosat,unknown=2'],'solveUnique')
+    @unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(),'needs fork')
+    def test_exited(self):
+        class Exiting(type(self._puzzle())):
+            def exit(self, code: int):
+                os._exit(code) # like being killed, no result is sent
+            def wait(self, seconds: float) -> str:
+                time.sleep(seconds)
+                return 'done'
+        puzzle = Exiting(2,2,[[0]*4 for _ in range(4)])
+        start = time.monotonic()
+        with self.assertRaisesRegex(AssertionError,'exited with code 3 without a result'):
+            puzzle.portfolio(['pycosat','pycosat,seed=1'],'exit',3)
+        self.assertLess(time.monotonic()-start,5)
+        with self.assertRaises(TimeoutError):
+            puzzle.portfolio(['pycosat'],'wait',10,timeout=0.2)
+        self.assertLess(time.monotonic()-start,5)
+        self.assertEqual(puzzle.portfolio(['pycosat'],'wait',0),('done','pycosat'))
+
+if __name__ == '__main__':
+    unittest.main()
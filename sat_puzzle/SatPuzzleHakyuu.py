@@ -1,4 +1,6 @@
 from . import SatPuzzleSuguruGeneral
+from cnf_utils import CnfBuffer
+from typing import Optional
 
 class SatPuzzleHakyuu(SatPuzzleSuguruGeneral):
     '''
@@ -20,7 +22,7 @@ class SatPuzzleHakyuu(SatPuzzleSuguruGeneral):
         assert all(len(row) == C for row in givens)
         assert len(areas) == R and all(len(row) == C for row in areas)
         super().__init__(R*C,sum(areas,[]),sum(givens,[]))
-    def toCnf(self) -> list[list[int]]:
+    def toCnf(self) -> CnfBuffer:
         '''
         For each cell c1 and a number n, x(c1,n) implies n is not assigned to
         some cells in the same row/col depending on n. For each cell c2 from 1
@@ -49,3 +51,5 @@ class SatPuzzleHakyuu(SatPuzzleSuguruGeneral):
     def toSol(self, satSol: list[int]) -> list[list[int]]:
         sol = super().toSol(satSol)
         return [sol[i:i+self.cols] for i in range(0,self.rows*self.cols,self.cols)]
+    def solLits(self, sol: list[list[int]]) -> Optional[list[int]]:
+        return super().solLits(sum(sol,[]))
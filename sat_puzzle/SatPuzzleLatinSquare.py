@@ -1,4 +1,5 @@
 from . import SatPuzzleSudokuGeneral
+from typing import Optional
 
 class SatPuzzleLatinSquare(SatPuzzleSudokuGeneral):
     '''
@@ -23,3 +24,5 @@ class SatPuzzleLatinSquare(SatPuzzleSudokuGeneral):
     def toSol(self, satSol: list[int]) -> list[list[int]]: # change structure to square
         sol = super().toSol(satSol)
         return [sol[i:i+self.nums] for i in range(0,self.cells,self.nums)]
+    def solLits(self, sol: list[list[int]]) -> Optional[list[int]]:
+        return super().solLits(sum(sol,[]))
@@ -1,10 +1,20 @@
 from . import SatPuzzleSudokuStandard
+from cnf_utils import CnfBuffer
+from cnf_encodings import order_ladder
+from itertools import count
 
 class SatPuzzleSudokuComparison(SatPuzzleSudokuStandard):
     '''
     Empty Sudoku grid with all cell borders inside the sub blocks showing a less
     than relation between adjacent cell pairs (within the same sub block).
+
+    The relations use the relation_encoding, 'direct' (clauses excluding each
+    pair of values violating a relation, quadratic in N) or 'order' (variables
+    for value >= k in each cell, a relation is then linear in N).
     '''
+    # less than relation encoding (can be set per instance)
+    relation_encoding = 'direct'
+    cnf_options = SatPuzzleSudokuStandard.cnf_options + ('relation_encoding',)
     def __init__(self, blockR: int, blockC: int, relations: set[tuple[tuple[int,int],tuple[int,int]]]):
         '''
         blockR = rows per sub block
@@ -15,13 +25,18 @@ class SatPuzzleSudokuComparison(SatPuzzleSudokuStandard):
         super().__init__(blockR,blockC,[[0]*(N) for _ in range(N)])
         assert all(0 <= r1 < N and 0 <= c1 < N and 0 <= r2 < N and 0 <= c2 < N for (r1,c1),(r2,c2) in relations)
         self.relations = set(p for p in relations)
-    def toCnf(self) -> list[list[int]]:
+    def toCnf(self) -> CnfBuffer:
         '''
         For each cell pair c1,c2 with c1 value < c2 value, add clauses:
         not x(c1,b) or not x(c2,a) for 1 <= a < b <= N
         This disallows all assignments that violate the less than constraint.
+        This is the 'direct' relation_encoding, see orderCnf for 'order'.
         '''
         result = super().toCnf()
+        if self.relation_encoding == 'order':
+            self.orderCnf(result)
+            return result
+        assert self.relation_encoding == 'direct', f'unknown relation encoding {self.relation_encoding}'
         N = self.nums
         x = lambda r,c,n : 1 + (r*N+c)*N + (n-1) # get variable number
         for (r1,c1),(r2,c2) in self.relations:
@@ -30,3 +45,30 @@ class SatPuzzleSudokuComparison(SatPuzzleSudokuStandard):
                 for b in range(a+1,N+1):
                     result.append([-x(r1,c1,b),-x(r2,c2,a)])
         return result
+    def orderCnf(self, result: CnfBuffer):
+        '''
+        Adds the relations with the order (ladder) encoding to result.
+        variables: g(c,k) (value of cell c >= k, 2 <= k <= N, for cells in a
+        relation), numbered after the variables already used. g(c,1) is true
+        and g(c,N+1) is false, so literals of these are simplified.
+        constraints:
+        - g(c,k+1) implies g(c,k)
+        - channeling: x(c,n) is equivalent to g(c,n) and not g(c,n+1)
+          (see cnf_encodings.order_ladder)
+        - for each cell pair c1,c2 with c1 value < c2 value, g(c1,k) implies
+          g(c2,k+1) (for 1 <= k <= N)
+        '''
+        N = self.nums
+        x = lambda r,c,n : 1 + (r*N+c)*N + (n-1)
+        new_var = count(max(result.variables,self.cells*N)+1).__next__
+        ladders: dict[tuple[int,int],list[int]] = dict()
+        for pair in self.relations:
+            for r,c in pair:
+                if (r,c) not in ladders:
+                    ladders[(r,c)] = order_ladder(result,[x(r,c,n) for n in range(1,N+1)],new_var)
+        for p1,p2 in self.relations:
+            g1,g2 = ladders[p1],ladders[p2]
+            result.append([g2[2]]) # k = 1
+            for k in range(2,N):
+                result.append([-g1[k],g2[k+1]])
+            result.append([-g1[N]]) # k = N
@@ -1,4 +1,5 @@
 from . import SatPuzzleLatinSquare
+from cnf_utils import CnfBuffer
 
 class SatPuzzleSudokuConsecutive(SatPuzzleLatinSquare):
     '''
@@ -15,7 +16,7 @@ class SatPuzzleSudokuConsecutive(SatPuzzleLatinSquare):
         super().__init__(givens)
         assert all(0 <= r1 < N and 0 <= c1 < N and 0 <= r2 < N and 0 <= c2 < N for (r1,c1),(r2,c2) in consec_pairs)
         self.consec_pairs = set(p for p in consec_pairs)
-    def toCnf(self) -> list[list[int]]: # extend to add extra constraints
+    def toCnf(self) -> CnfBuffer: # extend to add extra constraints
         '''
         Add constraints for orthogonally adjacent cells
         Let c1,c2 be the cells and x(c,n) mean the variable for n assigned to
@@ -1,11 +1,50 @@
 from . import SatPuzzleBase
+from cnf_utils import CnfBuffer
+from cnf_encodings import amo_encodings
+from array import array
+from functools import lru_cache
+from itertools import count
+from typing import Optional
+import unittest
+
+@lru_cache(maxsize=None)
+def _pair_indexes(n: int) -> array:
+    '''
+    flattened index pairs a,b (0 <= a < b < n) in the order the nested loops
+    over pairs produce them, used as a template for pairwise clause blocks
+    '''
+    return array('i',(i for a in range(n) for b in range(a+1,n) for i in (a,b)))
 
 class SatPuzzleSudokuGeneral(SatPuzzleBase):
     '''
     A generalization of Sudoku, representing a puzzle as C > 0 cells (numbered
     0, 1, ..., C-1), a parameter N > 0, and sets of N cells (areas) which are
     constrained to contain the numbers 1, 2, ..., N, each exactly once.
+
+    All clauses except the givens depend only on the geometry (cells, N and the
+    areas), so they are cached per geometry for the whole process. Puzzles of
+    the same shape (such as all 9x9 standard Sudokus, all Samurai layouts or
+    Jigsaws sharing an area map) encode their structure only once.
+
+    With domain_encoding enabled, each cell instead gets an explicit set of
+    possible values (see cellCandidates) reduced by eliminating the values of
+    fixed cells from their areas. Only values still possible get variables and
+    clauses, cells with a single possible value get none. Subclass extensions
+    keep using the x(c,n) numbering, getCnf simplifies their clauses for the
+    eliminated values and renumbers the remaining variables.
+
+    The at most one constraints (for cells and for each value in an area) use
+    the amo_encoding (see cnf_encodings.amo_encodings). Encodings other than
+    pairwise add auxiliary variables numbered after all x(c,n) variables.
     '''
+    # geometry key -> structural clauses, oldest entries evicted first
+    _structure_cache: dict[tuple,CnfBuffer] = dict()
+    structure_cache_size = 32
+    # use the domain based encoding (can be set per instance)
+    domain_encoding = False
+    # at most one encoding (can be set per instance)
+    amo_encoding = 'pairwise'
+    cnf_options = ('domain_encoding','amo_encoding')
     def __init__(self, cells: int, nums: int, areas: list[list[int]], givens: list[int]):
         '''
         cells = number of cells, numbered starting from 0
@@ -22,7 +61,7 @@ class SatPuzzleSudokuGeneral(SatPuzzleBase):
         self.nums = nums
         self.areas = [a[:] for a in areas]
         self.givens = givens[:]
-    def toCnf(self) -> list[list[int]]:
+    def toCnf(self) -> CnfBuffer:
         '''
         variables: x(c,n) (0 <= c < cells, 1 <= n <= N)
         constraints:
@@ -39,31 +78,256 @@ class SatPuzzleSudokuGeneral(SatPuzzleBase):
         - use the given clues
           - x(c,i) (for each cell c with a given value i)
         '''
-        result: list[list[int]] = []
-        x = lambda c,n : 1 + c*self.nums + (n-1)
-        for c in range(self.cells): # each cell has a value
-            result.append([x(c,n) for n in range(1,self.nums+1)])
-        for c in range(self.cells): # each cell has at most 1 value (for any 2 distinct values, one is not assigned to that cell)
-            for n1 in range(1,self.nums+1):
-                for n2 in range(n1+1,self.nums+1):
-                    result.append([-x(c,n1),-x(c,n2)])
-        for area in self.areas: # for each area
-            for n in range(1,self.nums+1): # has each number
-                result.append([x(c,n) for c in area])
-                # add redundant clauses for efficiency
-                for i,c1 in enumerate(area): # for any 2 cells, one does not have n (no duplicated numbers in an area)
-                    for c2 in area[i+1:]:
-                        result.append([-x(c1,n),-x(c2,n)])
+        if self.domain_encoding:
+            return self.domainCnf()
+        result = self.cachedStructureCnf().copy()
+        N = self.nums
         for c,n in enumerate(self.givens): # use the given clues
             if n != 0:
-                result.append([x(c,n)])
+                result.append([c*N+n])
+        return result
+    def geometryKey(self) -> tuple:
+        '''
+        Key determining the structural clauses (everything except the givens).
+        '''
+        return (self.cells,self.nums,tuple(map(tuple,self.areas)))
+    def cachedStructureCnf(self) -> CnfBuffer:
+        '''
+        structureCnf from the cache (added if not there), must not be modified.
+        '''
+        key = (self.amo_encoding,self.geometryKey())
+        cache = SatPuzzleSudokuGeneral._structure_cache
+        structure = cache.get(key)
+        if structure is None:
+            structure = self.structureCnf()
+            if len(cache) >= SatPuzzleSudokuGeneral.structure_cache_size:
+                del cache[next(iter(cache))]
+            cache[key] = structure
+        return structure
+    def sessionKey(self) -> Optional[tuple]:
+        '''
+        Sessions are used if toCnf is the structure and givens, not extended by
+        a subclass or using the domain encoding.
+        '''
+        if self.domain_encoding or type(self).toCnf is not SatPuzzleSudokuGeneral.toCnf:
+            return None
+        options = tuple(getattr(self,name) for name in self.cnf_options)
+        return (SatPuzzleSudokuGeneral,options,self.geometryKey())
+    def sessionCnf(self) -> CnfBuffer:
+        return self.cachedStructureCnf()
+    def sessionAssumptions(self) -> list[int]:
+        N = self.nums
+        return [c*N+n for c,n in enumerate(self.givens) if n != 0]
+    def structureCnf(self) -> CnfBuffer:
+        '''
+        The clauses from toCnf except for the givens (not cached).
+        '''
+        if self.amo_encoding != 'pairwise':
+            return self._structureCnfAmo()
+        result = CnfBuffer()
+        N = self.nums
+        # x(c,n) = 1 + c*N + (n-1), the clause blocks are built by shifting
+        # templates of the pair indexes instead of computing each literal
+        pairs = _pair_indexes(N)
+        # each cell has a value (clause for cell c is x(c,1),...,x(c,N))
+        result.extend_fixed(range(1,self.cells*N+1),N)
+        # each cell has at most 1 value (for any 2 distinct values, one is not assigned to that cell)
+        cell_pairs = array('i',(-1-i for i in pairs)) # -x(0,a+1),-x(0,b+1)
+        for c in range(self.cells):
+            result.extend_fixed(map((-c*N).__add__,cell_pairs),2)
+        for area in self.areas: # for each area
+            base = [c*N for c in area] # x(c,n) = base + n
+            area_pairs = array('i',(-base[i] for i in _pair_indexes(len(area))))
+            for n in range(1,N+1): # has each number
+                result.append(map(n.__add__,base))
+                # add redundant clauses for efficiency
+                # for any 2 cells, one does not have n (no duplicated numbers in an area)
+                result.extend_fixed(map((-n).__add__,area_pairs),2)
         return result
+    def _structureCnfAmo(self) -> CnfBuffer:
+        '''
+        structureCnf with the at most one constraints in the amo_encoding.
+        '''
+        result = CnfBuffer()
+        N = self.nums
+        amo = amo_encodings[self.amo_encoding]
+        new_var = count(self.cells*N+1).__next__
+        result.extend_fixed(range(1,self.cells*N+1),N)
+        for c in range(self.cells):
+            amo(result,range(c*N+1,c*N+N+1),new_var)
+        for area in self.areas:
+            base = [c*N for c in area]
+            for n in range(1,N+1):
+                result.append(map(n.__add__,base))
+                amo(result,[b+n for b in base],new_var)
+        return result
+    def cellCandidates(self) -> list[set[int]]:
+        '''
+        Values allowed in each cell before eliminating values using the areas.
+        Subclasses restricting cell values should extend this to make use of
+        the domain based encoding.
+        '''
+        values = set(range(1,self.nums+1))
+        return [set(values) if n == 0 else {n} for n in self.givens]
+    def cellDomains(self) -> list[set[int]]:
+        '''
+        The cell candidates with the value of each cell having a single value
+        removed from the other cells in its areas (repeated while this fixes
+        more cells).
+        '''
+        domains = self.cellCandidates()
+        cell_areas: list[list[int]] = [[] for _ in range(self.cells)]
+        for i,area in enumerate(self.areas):
+            for c in area:
+                cell_areas[c].append(i)
+        fixed = [c for c,d in enumerate(domains) if len(d) == 1]
+        while fixed:
+            c = fixed.pop()
+            if len(domains[c]) != 1: # emptied after being fixed, no solution
+                continue
+            n, = domains[c]
+            for i in cell_areas[c]:
+                for c2 in self.areas[i]:
+                    if c2 != c and n in domains[c2]:
+                        domains[c2].discard(n)
+                        if len(domains[c2]) == 1:
+                            fixed.append(c2)
+        return domains
+    def _domainMap(self) -> tuple[list[set[int]],array,array]:
+        '''
+        (domains, x(c,n) -> variable, variable -> x(c,n)) for the domain based
+        encoding. x(c,n) maps to 0 if n is impossible and -1 if c is fixed to n.
+        '''
+        if '_domainmap' not in self.__dict__:
+            N = self.nums
+            domains = self.cellDomains()
+            var = array('i',[0])*(self.cells*N+1)
+            dense = array('i',[0]) # inverse mapping, index 0 unused
+            for c,domain in enumerate(domains):
+                for n in sorted(domain):
+                    if len(domain) == 1:
+                        var[c*N+n] = -1
+                    else:
+                        var[c*N+n] = len(dense)
+                        dense.append(c*N+n)
+            self._domainmap = (domains,var,dense)
+        return self._domainmap
+    def invalidateCnf(self):
+        super().invalidateCnf()
+        self.__dict__.pop('_domainmap',None)
+    def domainCnf(self) -> CnfBuffer:
+        '''
+        The toCnf clauses for the domain based encoding, generated only for the
+        possible values (still using x(c,n) numbering).
+        '''
+        result = CnfBuffer()
+        N = self.nums
+        domains = self._domainMap()[0]
+        amo = amo_encodings[self.amo_encoding]
+        new_var = count(self.cells*N+1).__next__
+        for c,domain in enumerate(domains):
+            if len(domain) != 1: # cell has 1 value, fixed cells need no clauses
+                lits = [c*N+n for n in sorted(domain)]
+                result.append(lits)
+                amo(result,lits,new_var)
+        for area in self.areas:
+            for n in range(1,N+1):
+                cells = [c for c in area if n in domains[c]]
+                if any(len(domains[c]) == 1 for c in cells):
+                    continue # fixed cell has n, others were eliminated
+                lits = [c*N+n for c in cells]
+                result.append(lits)
+                amo(result,lits,new_var)
+        return result
+    def finishCnf(self, cnf: CnfBuffer) -> CnfBuffer:
+        '''
+        For the domain based encoding, simplify the clauses using the values
+        known to be impossible or fixed and renumber the variables to only those
+        of possible values (other variables above all x(c,n) are kept after).
+        '''
+        if not self.domain_encoding:
+            return cnf
+        _,var,dense = self._domainMap()
+        cells_vars = self.cells*self.nums
+        V = max(cnf.variables,cells_vars)
+        TRUE = V+len(dense) # marker for a literal known to be true
+        # literal l -> table[l+V], 0 for a false literal
+        table = array('i',[0])*(2*V+1)
+        for v in range(1,V+1):
+            m = var[v] if v <= cells_vars else v-cells_vars+len(dense)-1
+            table[V+v] = TRUE if m == -1 else m
+            table[V-v] = 0 if m == -1 else (TRUE if m == 0 else -m)
+        lits = array('i',map(table.__getitem__,map(V.__add__,cnf.lits)))
+        offsets = cnf.offsets
+        result = CnfBuffer()
+        for i in range(len(cnf)):
+            clause = lits[offsets[i]:offsets[i+1]]
+            if TRUE in clause:
+                continue
+            result.append(filter(None,clause) if 0 in clause else clause)
+        return result
+    @staticmethod
+    def clearStructureCache():
+        '''
+        Remove all cached structural clauses.
+        '''
+        SatPuzzleSudokuGeneral._structure_cache.clear()
     def toSol(self, satSol: list[int]) -> list[int]:
         result = [0]*self.cells
         to_c_n = lambda v : ((v-1)//self.nums, (v-1)%self.nums + 1)
-        for v in filter(lambda x : x > 0, satSol):
+        limit = self.cells*self.nums # larger variables are not x(c,n)
+        if self.domain_encoding:
+            domains,_,dense = self._domainMap()
+            for c,domain in enumerate(domains):
+                if len(domain) == 1:
+                    result[c], = domain
+            satSol = [dense[v] for v in satSol if 0 < v < len(dense)]
+        for v in filter(lambda x : 0 < x <= limit, satSol):
             c,n = to_c_n(v)
             assert result[c] == 0 # only 1 value assigned to a cell
             result[c] = n
         assert all(n > 0 for n in result) # every cell has a value
         return result
+    def solLits(self, sol: list[int]) -> Optional[list[int]]:
+        if len(sol) != self.cells or not all(1 <= n <= self.nums for n in sol):
+            return None
+        N = self.nums
+        if not self.domain_encoding:
+            return [c*N+n for c,n in enumerate(sol)]
+        _,var,_ = self._domainMap()
+        result: list[int] = []
+        for c,n in enumerate(sol):
+            v = var[c*N+n]
+            if v == 0: # value eliminated
+                return None
+            if v > 0: # fixed cells have no variable
+                result.append(v)
+        return result
+
+class TestDomainEncoding(unittest.TestCase):
+    def _solutions(self, puzzle, domain_encoding, amo_encoding):
+        puzzle.domain_encoding = domain_encoding
+        puzzle.amo_encoding = amo_encoding
+        return set(tuple(map(tuple,sol)) for sol in puzzle.solveAll())
+    def test_same_solutions(self):
+        from . import SatPuzzleSudokuStandard
+        puzzles = [SatPuzzleSudokuStandard(2,2,[[1,0,0,0],[0,0,1,0],[0,0,0,0],[0,0,0,0]]),
+            SatPuzzleSudokuStandard(2,3,[[1,2,0,0,0,0],[0,0,0,1,2,0],[0,0,0,0,0,0],
+                [0,0,0,0,0,0],[2,0,0,0,0,1],[0,0,0,3,0,0]])]
+        for puzzle in puzzles:
+            dense = self._solutions(puzzle,False,'pairwise')
+            self.assertTrue(len(dense) > 1)
+            for amo in amo_encodings:
+                self.assertEqual(self._solutions(puzzle,False,amo),dense)
+                self.assertEqual(self._solutions(puzzle,True,amo),dense)
+    def test_empty_domain(self):
+        from . import SatPuzzleSudokuStandard
+        # the second given empties the domain of the first given cell
+        puzzle = SatPuzzleSudokuStandard(2,2,[[1,1,0,0],[0,0,0,0],[0,0,0,0],[0,0,0,0]])
+        puzzle.domain_encoding = True
+        self.assertIn(set(),puzzle.cellDomains())
+        self.assertEqual(puzzle.solveUnique(),('none',None))
+        self.assertEqual(list(puzzle.solveAll()),[])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+from . import SatPuzzleSudokuStandard
+from cnf_utils import CnfBuffer
+from cnf_encodings import amo_encodings, sum_mdd
+from functools import lru_cache
+from itertools import combinations, count
+from typing import Any, Optional
+import unittest
+
+@lru_cache(maxsize=None)
+def _cage_combinations(N: int, size: int, total: int) -> tuple[frozenset[int],...]:
+    '''
+    all sets of size distinct numbers from 1..N with the given total
+    '''
+    return tuple(frozenset(s) for s in combinations(range(1,N+1),size) if sum(s) == total)
+
+class SatPuzzleSudokuKiller(SatPuzzleSudokuStandard):
+    '''
+    Sudoku with the grid divided into cages, each with the sum of its numbers
+    given. Numbers cannot repeat within a cage (unless distinct is False).
+
+    The combinations of distinct numbers with each cage sum (cached for each
+    N, cage size and sum) restrict the values possible in the cage cells and
+    give the numbers every combination contains. The sum itself uses the
+    partial sum encoding (see cnf_encodings.sum_mdd) over the possible values.
+    '''
+    def __init__(self, blockR: int, blockC: int, givens: list[list[int]], cages: list[list[Any]],
+            sums: dict[Any,Optional[int]], distinct: bool = True):
+        '''
+        blockR = rows per sub block
+        blockC = cols per sub block
+        givens = N x N grid of given numbers, 0 for no given (N = blockR*blockC)
+        cages = N x N grid of the cage of each cell (each cage is a unique symbol)
+        sums = sum of the numbers in each cage (None or missing for no sum)
+        distinct = numbers cannot repeat within a cage
+        '''
+        super().__init__(blockR,blockC,givens)
+        N = self.nums
+        assert len(cages) == N and all(len(row) == N for row in cages)
+        cells: dict[Any,list[int]] = dict()
+        for c,symb in enumerate(sum(cages,[])):
+            cells.setdefault(symb,[]).append(c)
+        self.cages = [(cage,sums.get(symb)) for symb,cage in cells.items()]
+        self.distinct = distinct
+        assert all(not distinct or len(cage) <= N for cage,_ in self.cages)
+    def cageValues(self) -> list[tuple[list[int],Optional[int],set[int],set[int]]]:
+        '''
+        (cells, sum, possible values, values required in the cage) for each
+        cage from the distinct combinations with its sum (all values possible
+        and none required without a sum or if numbers can repeat)
+        '''
+        N = self.nums
+        result = []
+        for cage,total in self.cages:
+            possible = set(range(1,N+1))
+            required: set[int] = set()
+            if total is not None and self.distinct:
+                combos = _cage_combinations(N,len(cage),total)
+                possible = set().union(*combos)
+                required = set(frozenset.intersection(*combos)) if combos else set()
+            elif total is not None: # each cell is at least 1
+                possible = set(range(1,min(N,total-len(cage)+1)+1))
+            result.append((cage,total,possible,required))
+        return result
+    def cellCandidates(self) -> list[set[int]]:
+        result = super().cellCandidates()
+        for cage,_,possible,_ in self.cageValues():
+            for c in cage:
+                result[c] &= possible
+        return result
+    def toCnf(self) -> CnfBuffer:
+        '''
+        variables: partial sums of sum_mdd, numbered after the variables used
+        constraints for each cage:
+        - values not in any combination with the cage sum are impossible
+          - not x(c,n)
+        - values in every combination appear in the cage
+          - x(c1,n) or x(c2,n) or ... (for cage cells c1,c2,...)
+        - numbers do not repeat (at most one cage cell has n, in amo_encoding)
+        - sum of cage cells (using the possible values) equals the cage sum
+        '''
+        result = super().toCnf()
+        N = self.nums
+        new_var = count(max(result.variables,self.cells*N)+1).__next__
+        amo = amo_encodings[self.amo_encoding]
+        for cage,total,possible,required in self.cageValues():
+            for c in cage:
+                for n in range(1,N+1):
+                    if n not in possible:
+                        result.append([-(c*N+n)])
+            for n in sorted(required):
+                result.append([c*N+n for c in cage])
+            if self.distinct:
+                for n in sorted(possible):
+                    amo(result,[c*N+n for c in cage],new_var)
+            if total is not None and len(possible) > 0:
+                terms = [{n: c*N+n for n in sorted(possible)} for c in cage]
+                sum_mdd(result,terms,total,new_var)
+        return result
+
+class TestKiller(unittest.TestCase):
+    def test_all_4x4(self):
+        # compare with checking the cages of every 4x4 sudoku
+        import random
+        rng = random.Random(1)
+        grids = [sum(sol,[]) for sol in SatPuzzleSudokuStandard(2,2,[[0]*4]*4).solveAll()]
+        self.assertEqual(len(grids),288)
+        for test in range(40):
+            distinct = test%4 != 3
+            grid = rng.choice(grids)
+            cells = list(range(16))
+            rng.shuffle(cells)
+            cages: list[list[int]] = []
+            for c in cells: # the grid has distinct numbers in the cages if distinct
+                options = [cage for cage in cages if len(cage) < (4 if distinct else 6)
+                    and not (distinct and grid[c] in (grid[c2] for c2 in cage))]
+                if options and rng.random() < 0.8:
+                    rng.choice(options).append(c)
+                else:
+                    cages.append([c])
+            sums = {i: sum(grid[c] for c in cage) for i,cage in enumerate(cages)}
+            for i in rng.sample(range(len(cages)),len(cages)//2): # no sum
+                sums[i] = None
+            if test%3 == 0: # possibly another sum
+                i = rng.randrange(len(cages))
+                sums[i] = rng.randint(1,4*len(cages[i]))
+            symbols = [0]*16
+            for i,cage in enumerate(cages):
+                for c in cage:
+                    symbols[c] = i
+            givens = [[0]*4 for _ in range(4)]
+            if test%2: # also a given
+                c = rng.randrange(16)
+                givens[c//4][c%4] = grid[c]
+            expected = set(tuple(g) for g in grids if all(given in (0,n) for given,n in zip(sum(givens,[]),g))
+                and all(sums[i] is None or sum(g[c] for c in cage) == sums[i] for i,cage in enumerate(cages))
+                and (not distinct or all(len(set(g[c] for c in cage)) == len(cage) for cage in cages)))
+            for domain_encoding,amo in ((False,'pairwise'),(True,'pairwise'),(False,'sequential'),(True,'bimander')):
+                puzzle = SatPuzzleSudokuKiller(2,2,givens,[symbols[r*4:r*4+4] for r in range(4)],sums,distinct)
+                puzzle.domain_encoding = domain_encoding
+                puzzle.amo_encoding = amo
+                found = set(tuple(sum(sol,[])) for sol in puzzle.solveAll())
+                self.assertEqual(found,expected,f'{cages} {sums} {distinct} {givens}')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 from . import SatPuzzleSudokuStandard
+from cnf_utils import CnfBuffer
 
 class SatPuzzleSudokuKropki(SatPuzzleSudokuStandard):
     '''
@@ -20,7 +21,7 @@ class SatPuzzleSudokuKropki(SatPuzzleSudokuStandard):
         assert white & black == set()
         self.white = set(p for p in white)
         self.black = set(p for p in black)
-    def toCnf(self) -> list[list[int]]: # extend to add extra constraints
+    def toCnf(self) -> CnfBuffer: # extend to add extra constraints
         '''
         These constraints are handled similarly to those in Consecutive Sudoku.
         For each pair of cells c1,c2 and each pair a,b of (distinct) cell values
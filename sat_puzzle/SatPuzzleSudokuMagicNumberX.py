@@ -1,4 +1,5 @@
 from . import SatPuzzleLatinSquareX
+from cnf_utils import CnfBuffer
 
 class SatPuzzleSudokuMagicNumberX(SatPuzzleLatinSquareX):
     '''
@@ -16,7 +17,7 @@ class SatPuzzleSudokuMagicNumberX(SatPuzzleLatinSquareX):
         self.magic = magic
         assert all(0 <= r1 < N and 0 <= c1 < N and 0 <= r2 < N and 0 <= c2 < N for (r1,c1),(r2,c2) in pairs)
         self.pairs = set(p for p in pairs)
-    def toCnf(self) -> list[list[int]]:
+    def toCnf(self) -> CnfBuffer:
         '''
         Add constraints for orthogonally adjacent cells similar to in
         Consecutive Sudoku where clauses are added for each pair that is not
@@ -1,11 +1,37 @@
 from . import SatPuzzleSudokuStandard
-from typing import Generator
+from cnf_utils import CnfBuffer
+from cnf_encodings import sum_mdd
+from functools import lru_cache
+from itertools import chain, count
+from math import factorial, perm
+from typing import Generator, Iterable, Iterator
+
+@lru_cache(maxsize=None)
+def _subset_sums(N: int, size: int) -> dict[int,int]:
+    '''
+    maps each sum to the number of sets of size distinct numbers from 1..N
+    with that sum
+    '''
+    counts = [dict() for _ in range(size+1)] # counts[k][s] using numbers so far
+    counts[0][0] = 1
+    for n in range(1,N+1):
+        for k in range(min(n,size),0,-1):
+            for s,ways in counts[k-1].items():
+                counts[k][s+n] = counts[k].get(s+n,0) + ways
+    return counts[size]
 
 class SatPuzzleSudokuMarginalSum(SatPuzzleSudokuStandard):
     '''
     Sudoku grid with no given cell clues. The clues given are the sum of the
     first 3 numbers from the edges. This class extends to other sub block sizes.
+
+    The sums use the sum_encoding, 'permutations' (clauses excluding each
+    permutation with a wrong sum, exponential in the block size) or 'mdd'
+    (partial sum variables, see cnf_encodings.sum_mdd, polynomial size).
     '''
+    # marginal sum encoding (can be set per instance)
+    sum_encoding = 'permutations'
+    cnf_options = SatPuzzleSudokuStandard.cnf_options + ('sum_encoding',)
     def __init__(self, blockR: int, blockC: int, top: list[int], bottom: list[int], left: list[int], right: list[int]):
         '''
         blockR = rows per sub block
@@ -22,17 +48,43 @@ class SatPuzzleSudokuMarginalSum(SatPuzzleSudokuStandard):
         self.bottom = bottom[:]
         self.left = left[:]
         self.right = right[:]
-    def toCnf(self) -> list[list[int]]:
+    def toCnf(self) -> CnfBuffer:
         '''
         The marginal sum constraints can be represented as clauses for the
         permutations of numbers not allowed (not n1 or not n2 or ...). If the
         numbers are assigned one of the disallowed permutations, there will be
         a false clause. Otherwise, all these clauses will be true. This grows
         exponentially in the blockR and blockC parameters so it is not a proper
-        reduction.
-        TODO research ways to make this reduction polynomial time and space
+        reduction. This is the 'permutations' sum_encoding, the 'mdd' one adds
+        variables for the partial sums instead, which is polynomial.
         '''
         result = super().toCnf()
+        if self.sum_encoding == 'mdd':
+            self._sumMdd(result)
+        else:
+            assert self.sum_encoding == 'permutations', f'unknown sum encoding {self.sum_encoding}'
+            result.extend(self._sumClauses())
+        return result
+    def _sumMdd(self, result: CnfBuffer):
+        '''
+        adds the marginal sums with sum_mdd, the partial sum variables are
+        numbered after the variables already used
+        '''
+        N = self.nums
+        br = self.blockR
+        bc = self.blockC
+        x = lambda r,c,n : 1 + (r*N+c)*N + (n-1)
+        new_var = count(max(result.variables,self.cells*N)+1).__next__
+        terms = lambda cells : [{n: x(r,c,n) for n in range(1,N+1)} for r,c in cells]
+        for i in range(N):
+            sum_mdd(result,terms((j,i) for j in range(br)),self.top[i],new_var)
+            sum_mdd(result,terms((N-br+j,i) for j in range(br)),self.bottom[i],new_var)
+            sum_mdd(result,terms((i,j) for j in range(bc)),self.left[i],new_var)
+            sum_mdd(result,terms((i,N-bc+j) for j in range(bc)),self.right[i],new_var)
+    def _sumClauses(self) -> Generator[list[int],None,None]:
+        '''
+        generates the clauses for the marginal sums (described in toCnf)
+        '''
         N = self.nums
         br = self.blockR
         bc = self.blockC
@@ -49,14 +101,30 @@ class SatPuzzleSudokuMarginalSum(SatPuzzleSudokuStandard):
         for i in range(N):
             for perm in recur(br): # top
                 if sum(perm) != self.top[i]:
-                    result.append([-x(j,i,perm[j]) for j in range(br)])
+                    yield [-x(j,i,perm[j]) for j in range(br)]
             for perm in recur(br): # bottom
                 if sum(perm) != self.bottom[i]:
-                    result.append([-x(N-br+j,i,perm[j]) for j in range(br)])
+                    yield [-x(N-br+j,i,perm[j]) for j in range(br)]
             for perm in recur(bc): # left
                 if sum(perm) != self.left[i]:
-                    result.append([-x(i,j,perm[j]) for j in range(bc)])
+                    yield [-x(i,j,perm[j]) for j in range(bc)]
             for perm in recur(bc): # right
                 if sum(perm) != self.right[i]:
-                    result.append([-x(i,N-bc+j,perm[j]) for j in range(bc)])
-        return result
+                    yield [-x(i,N-bc+j,perm[j]) for j in range(bc)]
+    def iterCnf(self) -> tuple[int,int,Iterator[Iterable[int]]]:
+        '''
+        Streams the marginal sum clauses instead of storing them. The number of
+        them is counted from the number of ways to pick distinct numbers with
+        each sum.
+        '''
+        if self.domain_encoding or self.sum_encoding != 'permutations' or '_cnf' in self.__dict__:
+            return super().iterCnf()
+        result = super().toCnf()
+        N = self.nums
+        def count(size: int, total: int) -> int: # permutations with a wrong sum
+            return perm(N,size) - factorial(size)*_subset_sums(N,size).get(total,0)
+        clauses = len(result)
+        for i in range(N):
+            clauses += count(self.blockR,self.top[i]) + count(self.blockR,self.bottom[i])
+            clauses += count(self.blockC,self.left[i]) + count(self.blockC,self.right[i])
+        return result.variables, clauses, chain(result,self._sumClauses())
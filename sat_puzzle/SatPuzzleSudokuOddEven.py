@@ -1,4 +1,5 @@
 from . import SatPuzzleSudokuStandard
+from cnf_utils import CnfBuffer
 
 class SatPuzzleSudokuOddEven(SatPuzzleSudokuStandard):
     '''
@@ -16,7 +17,7 @@ class SatPuzzleSudokuOddEven(SatPuzzleSudokuStandard):
         N = len(givens)
         assert len(odds) == N and all(len(row) == N for row in odds)
         self.odds = [row[:] for row in odds]
-    def toCnf(self) -> list[list[int]]:
+    def toCnf(self) -> CnfBuffer:
         '''
         Add constraints for odd and even cells. These are expressed as negations
         of assigning the opposite parity to cells.
@@ -33,3 +34,8 @@ class SatPuzzleSudokuOddEven(SatPuzzleSudokuStandard):
                     for n in range(1,N+1,2): # cannot be odd
                         result.append([-x(r,c,n)])
         return result
+    def cellCandidates(self) -> list[set[int]]:
+        result = super().cellCandidates()
+        for c,odd in enumerate(sum(self.odds,[])):
+            result[c] = set(n for n in result[c] if (n % 2 == 1) == odd)
+        return result
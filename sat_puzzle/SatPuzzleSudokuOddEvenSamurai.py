@@ -1,4 +1,5 @@
 from . import SatPuzzleSudokuSamurai
+from cnf_utils import CnfBuffer
 
 class SatPuzzleSudokuOddEvenSamurai(SatPuzzleSudokuSamurai):
     '''
@@ -12,7 +13,7 @@ class SatPuzzleSudokuOddEvenSamurai(SatPuzzleSudokuSamurai):
         super().__init__(givens)
         assert len(odds) == 21 and all(len(row) == 21 for row in odds)
         self.odds = [row[:] for row in odds]
-    def toCnf(self) -> list[list[int]]:
+    def toCnf(self) -> CnfBuffer:
         '''
         Handle these constraints with a more restrictive clause of possible
         values which makes the all value clauses redundant.
@@ -29,3 +30,10 @@ class SatPuzzleSudokuOddEvenSamurai(SatPuzzleSudokuSamurai):
                 else: # cell must be even
                     result.append([x(r,c,n) for n in range(2,10,2)])
         return result
+    def cellCandidates(self) -> list[set[int]]:
+        result = super().cellCandidates()
+        for r,row in enumerate(self.odds):
+            for c,odd in enumerate(row):
+                if self.blockmap[r//self.blockR][c//self.blockC]: # used block
+                    result[r*21+c] = set(n for n in result[r*21+c] if (n % 2 == 1) == odd)
+        return result
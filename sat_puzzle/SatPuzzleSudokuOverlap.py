@@ -1,4 +1,5 @@
 from . import SatPuzzleSudokuGeneral
+from typing import Optional
 
 class SatPuzzleSudokuOverlap(SatPuzzleSudokuGeneral):
     '''
@@ -59,3 +60,13 @@ class SatPuzzleSudokuOverlap(SatPuzzleSudokuGeneral):
                         for c in range(self.blockC):
                             gridSol[brow*self.blockR+r][bcol*self.blockC+c] = 0
         return gridSol
+    def solLits(self, sol: list[list[int]]) -> Optional[list[int]]:
+        # use the dummy number in unused areas
+        sol2 = [row[:] for row in sol]
+        for brow,blockmaprow in enumerate(self.blockmap):
+            for bcol,used in enumerate(blockmaprow):
+                if not used:
+                    for r in range(self.blockR):
+                        for c in range(self.blockC):
+                            sol2[brow*self.blockR+r][bcol*self.blockC+c] = 1
+        return super().solLits(sum(sol2,[]))
@@ -0,0 +1,132 @@
+from . import SatPuzzleSudokuStandard
+from cnf_utils import CnfBuffer
+from cnf_encodings import card_sequential, order_ladder
+from itertools import count
+import unittest
+
+class SatPuzzleSudokuSkyscraper(SatPuzzleSudokuStandard):
+    '''
+    Sudoku where the numbers are heights of buildings. A clue outside the grid
+    is the number of buildings visible from there looking along the row or
+    column (a building is hidden by any taller building in front of it).
+
+    Visibility is encoded with order variables (cell value >= k) and prefix
+    maximum variables, a building is visible if it is a new maximum. A counter
+    over these gives the clue, so the size is polynomial in N.
+    '''
+    def __init__(self, blockR: int, blockC: int, givens: list[list[int]],
+            top: list[int], bottom: list[int], left: list[int], right: list[int]):
+        '''
+        blockR = rows per sub block
+        blockC = cols per sub block
+        givens = N x N grid of given numbers, 0 for no given (N = blockR*blockC)
+        top = visible buildings looking down each column from the top, 0 for
+            no clue (similarly bottom looking up, left and right for each row)
+        '''
+        super().__init__(blockR,blockC,givens)
+        N = self.nums
+        assert len(top) == len(bottom) == len(left) == len(right) == N
+        assert all(0 <= k <= N for k in top+bottom+left+right)
+        self.top = top[:]
+        self.bottom = bottom[:]
+        self.left = left[:]
+        self.right = right[:]
+    def clueLines(self) -> list[tuple[list[int],int]]:
+        '''
+        (cells in viewing order, clue) for each clue
+        '''
+        N = self.nums
+        result = []
+        for i in range(N):
+            col = [r*N+i for r in range(N)]
+            row = [i*N+c for c in range(N)]
+            for line,k in ((col,self.top[i]),(col[::-1],self.bottom[i]),
+                    (row,self.left[i]),(row[::-1],self.right[i])):
+                if k != 0:
+                    result.append((line,k))
+        return result
+    def cellCandidates(self) -> list[set[int]]:
+        '''
+        With k visible, the building at distance d (from 0) is at most N-k+1+d
+        since k-1 buildings after it must be taller.
+        '''
+        result = super().cellCandidates()
+        N = self.nums
+        for line,k in self.clueLines():
+            for d,c in enumerate(line):
+                result[c] = set(n for n in result[c] if n <= N-k+1+d)
+        return result
+    def toCnf(self) -> CnfBuffer:
+        '''
+        variables (numbered after the variables already used):
+        - g(c,k) (value of cell c >= k, 2 <= k <= N, see cnf_encodings.order_ladder)
+        - m(i,k) (maximum of the first i+1 cells in a line >= k, i >= 1)
+        - v(i) (cell i in a line is visible, i >= 1, the first always is)
+        constraints for each line of cells c_0,c_1,..,c_{N-1} with clue K:
+        - m(0,k) is g(c_0,k), m(i,k) is equivalent to m(i-1,k) or g(c_i,k)
+        - v(i) is equivalent to x(c_i,n) and not m(i-1,n) for some n
+          - not x(c_i,n) or m(i-1,n) or v(i)
+          - not x(c_i,n) or not m(i-1,n) or not v(i)
+        - exactly K-1 of v(1),..,v(N-1) are true (card_sequential)
+        '''
+        result = super().toCnf()
+        N = self.nums
+        new_var = count(max(result.variables,self.cells*N)+1).__next__
+        ladders: dict[int,list[int]] = dict()
+        for line,K in self.clueLines():
+            for c in line:
+                if c not in ladders:
+                    ladders[c] = order_ladder(result,range(c*N+1,c*N+N+1),new_var)
+            m = ladders[line[0]] # m(i-1,k) = m[k]
+            visible: list[int] = []
+            for i in range(1,N):
+                c,g = line[i],ladders[line[i]]
+                v = new_var()
+                visible.append(v)
+                result.append([-(c*N+1),-v]) # max of the previous is >= 1
+                for n in range(2,N+1):
+                    result.append([-(c*N+n),m[n],v])
+                    result.append([-(c*N+n),-m[n],-v])
+                if i < N-1: # next prefix maximum
+                    m_next = [0,0]+[new_var() for _ in range(2,N+1)]
+                    for k in range(2,N+1):
+                        result.append([-m[k],m_next[k]])
+                        result.append([-g[k],m_next[k]])
+                        result.append([-m_next[k],m[k],g[k]])
+                    m = m_next
+            card_sequential(result,visible,K-1,K-1,new_var)
+        return result
+
+class TestSkyscraper(unittest.TestCase):
+    def test_all_4x4(self):
+        # compare with counting the visible buildings in every 4x4 sudoku
+        import random
+        rng = random.Random(1)
+        grids = [sum(sol,[]) for sol in SatPuzzleSudokuStandard(2,2,[[0]*4]*4).solveAll()]
+        self.assertEqual(len(grids),288)
+        def visible(grid: list[int], line: list[int]) -> int:
+            return sum(all(grid[c] > grid[c2] for c2 in line[:i]) for i,c in enumerate(line))
+        for test in range(40):
+            grid = rng.choice(grids)
+            sides = []
+            for side in range(4):
+                clues = []
+                for i in range(4):
+                    col = [r*4+i for r in range(4)]
+                    row = [i*4+c for c in range(4)]
+                    line = (col,col[::-1],row,row[::-1])[side]
+                    clues.append(visible(grid,line) if rng.random() < 0.3 else 0)
+                sides.append(clues)
+            if test%3 == 0: # possibly another clue
+                sides[rng.randrange(4)][rng.randrange(4)] = rng.randint(1,4)
+            puzzle = SatPuzzleSudokuSkyscraper(2,2,[[0]*4 for _ in range(4)],*sides)
+            expected = set(tuple(g) for g in grids if all(visible(g,line) == k for line,k in puzzle.clueLines()))
+            for domain_encoding,amo in ((False,'pairwise'),(True,'pairwise'),(False,'sequential'),(True,'bimander')):
+                puzzle = SatPuzzleSudokuSkyscraper(2,2,[[0]*4 for _ in range(4)],*sides)
+                puzzle.domain_encoding = domain_encoding
+                puzzle.amo_encoding = amo
+                found = set(tuple(sum(sol,[])) for sol in puzzle.solveAll())
+                self.assertEqual(found,expected,f'{sides}')
+
+if __name__ == '__main__':
+    unittest.main()
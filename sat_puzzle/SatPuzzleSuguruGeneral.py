@@ -1,4 +1,6 @@
 from . import SatPuzzleBase
+from cnf_utils import CnfBuffer
+from typing import Optional
 
 class SatPuzzleSuguruGeneral(SatPuzzleBase):
     '''
@@ -34,12 +36,12 @@ class SatPuzzleSuguruGeneral(SatPuzzleBase):
                 self.varmap[(i,n)] = last_var+n
                 self.varmaprev[last_var+n] = (i,n)
             last_var += area_size
-    def toCnf(self) -> list[list[int]]:
+    def toCnf(self) -> CnfBuffer:
         '''
         These look very similar to the Sudoku clauses, except the area size and
         amount of possible numbers is constrained by area sizes.
         '''
-        result: list[list[int]] = []
+        result = CnfBuffer()
         for c in range(self.cells): # each cell
             area_size = len(self.areasmap[self.areas[c]])
             result.append([self.varmap[(c,n)] for n in range(1,area_size+1)]) # has a value
@@ -66,3 +68,7 @@ class SatPuzzleSuguruGeneral(SatPuzzleBase):
             result[c] = n
         assert all(n > 0 for n in result)
         return result
+    def solLits(self, sol: list[int]) -> Optional[list[int]]:
+        if len(sol) != self.cells or not all((c,n) in self.varmap for c,n in enumerate(sol)):
+            return None
+        return [self.varmap[(c,n)] for c,n in enumerate(sol)]
@@ -1,4 +1,6 @@
 from . import SatPuzzleSuguruGeneral
+from cnf_utils import CnfBuffer
+from typing import Optional
 
 class SatPuzzleSuguruStandard(SatPuzzleSuguruGeneral):
     '''
@@ -19,7 +21,7 @@ class SatPuzzleSuguruStandard(SatPuzzleSuguruGeneral):
         assert all(len(row) == C for row in givens)
         assert len(areas) == R and all(len(row) == C for row in areas)
         super().__init__(R*C,sum(areas,[]),sum(givens,[]))
-    def toCnf(self) -> list[list[int]]:
+    def toCnf(self) -> CnfBuffer:
         '''
         For each cell c1, add up to 8 constraints for neighboring cells c2:
         - not x(c1,n) or not x(c2,n)
@@ -50,3 +52,5 @@ class SatPuzzleSuguruStandard(SatPuzzleSuguruGeneral):
     def toSol(self, satSol: list[int]) -> list[list[int]]:
         sol = super().toSol(satSol)
         return [sol[i:i+self.cols] for i in range(0,self.rows*self.cols,self.cols)]
+    def solLits(self, sol: list[list[int]]) -> Optional[list[int]]:
+        return super().solLits(sum(sol,[]))
@@ -1,4 +1,5 @@
 from . import SatPuzzleSudokuStandard
+from cnf_utils import CnfBuffer
 
 class SatPuzzleSukaku(SatPuzzleSudokuStandard):
     '''
@@ -15,7 +16,7 @@ class SatPuzzleSukaku(SatPuzzleSudokuStandard):
         assert len(candidates) == N and all(len(row) == N for row in candidates)
         assert all(all(len(set(values)) == len(values) and all(1 <= value <= N for value in values) for values in row) for row in candidates)
         self.candidates = [[values[:] for values in row] for row in candidates]
-    def toCnf(self) -> list[list[int]]:
+    def toCnf(self) -> CnfBuffer:
         '''
         The additional constraints added constrain cell values to those in the
         candidate sets. This makes the original constraints redundant for
@@ -28,3 +29,5 @@ class SatPuzzleSukaku(SatPuzzleSudokuStandard):
             for c in range(N):
                 result.append([x(r,c,n) for n in self.candidates[r][c]])
         return result
+    def cellCandidates(self) -> list[set[int]]:
+        return [set(values) for row in self.candidates for values in row]
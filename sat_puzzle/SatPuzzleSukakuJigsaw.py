@@ -1,4 +1,5 @@
 from . import SatPuzzleSudokuJigsaw
+from cnf_utils import CnfBuffer
 
 class SatPuzzleSukakuJigsaw(SatPuzzleSudokuJigsaw):
     '''
@@ -14,7 +15,7 @@ class SatPuzzleSukakuJigsaw(SatPuzzleSudokuJigsaw):
         assert len(candidates) == N and all(len(row) == N for row in candidates)
         assert all(all(len(set(values)) == len(values) and all(1 <= value <= N for value in values) for values in row) for row in candidates)
         self.candidates = [[values[:] for values in row] for row in candidates]
-    def toCnf(self) -> list[list[int]]:
+    def toCnf(self) -> CnfBuffer:
         '''
         The constraints here are handled exactly the same way as they are in
         regular Sukaku.
@@ -26,3 +27,5 @@ class SatPuzzleSukakuJigsaw(SatPuzzleSudokuJigsaw):
             for c in range(N):
                 result.append([x(r,c,n) for n in self.candidates[r][c]])
         return result
+    def cellCandidates(self) -> list[set[int]]:
+        return [set(values) for row in self.candidates for values in row]
@@ -34,6 +34,8 @@ from .SatPuzzleSuguruStandard import SatPuzzleSuguruStandard
 from .SatPuzzleHakyuu import SatPuzzleHakyuu
 from .SatPuzzleSukaku import SatPuzzleSukaku
 from .SatPuzzleSukakuJigsaw import SatPuzzleSukakuJigsaw
+from .SatPuzzleSudokuKiller import SatPuzzleSudokuKiller
+from .SatPuzzleSudokuSkyscraper import SatPuzzleSudokuSkyscraper
 
 # list of all classes in the module
 __all__ = \
@@ -69,5 +71,7 @@ __all__ = \
     'SatPuzzleSuguruStandard',
     'SatPuzzleHakyuu',
     'SatPuzzleSukaku',
-    'SatPuzzleSukakuJigsaw'
+    'SatPuzzleSukakuJigsaw',
+    'SatPuzzleSudokuKiller',
+    'SatPuzzleSudokuSkyscraper'
 ]